@@ -1,24 +1,28 @@
 import psycopg2
-from fastapi import APIRouter, HTTPException, status
-from passlib.context import CryptContext
+from fastapi import APIRouter, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 
 from auth import create_access_token, create_refresh_token, decode_refresh_token
 from dao.users_dao import UsersDAO
+from login_throttle import check_login, client_ip
+from password_hashing import verify_password
 from schemas.authModels import RefreshToken, UserLogin
 
 router = APIRouter()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 @router.post("/auth/login")
-def login(user: UserLogin):
+async def login(user: UserLogin, request: Request):
+    # Лимит попыток проверяется до БД и bcrypt — перебор паролей стоит один вызов Redis
+    await check_login(user.email, client_ip(request))
     try:
-        row = UsersDAO.get_auth_data(user.email)
+        row = await run_in_threadpool(UsersDAO.get_auth_data, user.email)
         if row is None:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
 
         user_id, password_hash = row
-        if not pwd_context.verify(user.password, password_hash):
+        # bcrypt считается в пуле процессов и не занимает event loop и GIL воркера
+        if not await verify_password(user.password, password_hash):
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
 
         return {
@@ -2,7 +2,9 @@ from fastapi import APIRouter, HTTPException
 import psycopg2
 
 from dao.bus_stops_dao import BusStopsDAO
+from pagination import IN_AREA_LIMIT, truncate
 from schemas.busStopsModels import BusStopCreate, BusStopUpdate
+from tile_cache import bump_layer_version
 
 router = APIRouter()
 
@@ -49,8 +51,8 @@ def get_in_area(
     max_lat: float
 ):
     try:
-        rows = BusStopsDAO.get_in_area(min_lat, max_lat, min_lon, max_lon)
-        return [_row_to_dict(row) for row in rows]
+        rows = BusStopsDAO.get_in_area(min_lat, max_lat, min_lon, max_lon, limit=IN_AREA_LIMIT + 1)
+        return truncate([_row_to_dict(row) for row in rows])
     except psycopg2.Error:
         raise HTTPException(status_code=500, detail="Database error")
 
@@ -85,6 +87,7 @@ def create_bus_stop(stop: BusStopCreate):
             stop.adm_area,
             stop.district
         )
+        bump_layer_version("bus_stops")
 
         return {"id": created[0]}
 
@@ -96,6 +99,7 @@ def create_bus_stop(stop: BusStopCreate):
 def update_bus_stop(stop_id: int, stop: BusStopUpdate):
     try:
         updated = BusStopsDAO.update(stop_id, stop)
+        bump_layer_version("bus_stops")
         return {"status": "updated", "id": updated[0]}
 
     except psycopg2.Error:
@@ -106,6 +110,7 @@ def update_bus_stop(stop_id: int, stop: BusStopUpdate):
 def delete_bus_stop(stop_id: int):
     try:
         deleted = BusStopsDAO.delete(stop_id)
+        bump_layer_version("bus_stops")
         return {"status": "deleted", "id": deleted[0]}
 
     except psycopg2.Error:
@@ -1,19 +1,32 @@
+from typing import Literal, Optional
+
 import psycopg2
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from psycopg2.extras import Json
 
 from dao.cameras_dao import CamerasDAO
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, make_page, resolve_after_id
+from streaming import ndjson_response
 from schemas.cameraModels import CameraCreate, CameraUpdate
 
 router = APIRouter()
 
 
 @router.get("/cameras")
-def get_cameras():
+def get_cameras(
+    after_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    format: Optional[Literal["ndjson"]] = None,
+):
+    """Страница камер; с format=ndjson — вся таблица потоком."""
+    fields = ["id", "description", "cv_data"]
+    if format == "ndjson":
+        return ndjson_response(CamerasDAO.iter_all(), lambda row: dict(zip(fields, row)))
+
     try:
-        rows = CamerasDAO.get_all()
-        fields = ["id", "description", "cv_data"]
-        return [dict(zip(fields, row)) for row in rows]
+        rows = CamerasDAO.get_all(resolve_after_id(after_id, cursor), limit + 1)
+        return make_page(rows, limit, lambda row: dict(zip(fields, row)), key=lambda row: row[0])
     except psycopg2.Error:
         raise HTTPException(status_code=500, detail="Database error")
 
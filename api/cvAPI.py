@@ -1,14 +1,42 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import asyncpg
 import psycopg2
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 
+import bbox_cache
+import occupancy_stream
+import swr_cache
+from async_database import DB_UNAVAILABLE_ERRORS
+from config import get_settings
+from l1_cache import CACHE_TIER_REQUESTS, l1_cache
 from dao.cv_dao import CvDAO
-from schemas.cvModels import ParkingUpdate
+from occupancy_buffer import occupancy_buffer
+from occupancy_stream import (
+    HEARTBEAT_INTERVAL,
+    OCCUPANCY_STREAM_CONNECTIONS,
+    PUSH_INTERVAL,
+    occupancy_hub,
+    parse_subscription,
+)
+from schemas.cvModels import OccupancyObservation, ParkingUpdate
 
+from redis_client import async_redis_client as async_redis
 from redis_client import redis_client as redis
 
 router = APIRouter()
 
 OCCUPANCY_CACHE_TTL = 60
+# После этого возраста значение из кэша ещё отдаётся, но обновляется в фоне
+OCCUPANCY_CACHE_SOFT_TTL = 45
+# Максимум наблюдений в одном пакетном запросе от контроллера камер
+MAX_OCCUPANCY_BATCH = 1000
+# Максимум парковок в одном запросе /parkings/status
+MAX_STATUS_IDS = 500
 
 @router.get("/data/")
 def get_cvdata():
@@ -23,50 +51,278 @@ def get_cvdata():
 
 @router.patch("/occupancy/{id_parking}")
 def update_occupancy(id_parking: int, parking: ParkingUpdate):
-    # Обновляем кэш с TTL — теперь данные автоматически устаревают через OCCUPANCY_CACHE_TTL секунд
-    redis.set(f"parking:{id_parking}:occupancy", parking.occupancy, ex=OCCUPANCY_CACHE_TTL)
+    key = f"parking:{id_parking}:occupancy"
+    if get_settings().occupancy_write_behind:
+        # Обновляем кэш с TTL и тем же pipeline сбрасываем L1 во всех процессах.
+        # В БД значение попадёт со следующей пачкой фонового потока; несуществующие id там отбросятся
+        pipe = redis.pipeline(transaction=False)
+        pipe.set(key, parking.occupancy, ex=OCCUPANCY_CACHE_TTL)
+        swr_cache.bump_generations([key], pipe)
+        l1_cache.invalidate([key], pipe)
+        pipe.execute()
+        occupancy_buffer.put(id_parking, parking.occupancy)
+        return {"message": f"Occupancy for parking ID {id_parking} accepted"}
 
     try:
-        row_count = CvDAO.update_occupancy(id_parking, parking.occupancy)
-        if row_count == 0:
-            raise HTTPException(status_code=404, detail="Parking not found")
-        return {"message": f"Occupancy for parking ID {id_parking} successfully updated"}
+        status, bbox = CvDAO.update_occupancy(id_parking, parking.occupancy, datetime.now(timezone.utc))
     except psycopg2.Error:
         raise HTTPException(status_code=400, detail="Failed to update occupancy")
+    if status == "not_found":
+        raise HTTPException(status_code=404, detail="Parking not found")
+    if status == "stale":
+        # Параллельно принятое более позднее наблюдение уже записано — кэш не трогаем
+        return {"message": f"Occupancy for parking ID {id_parking} superseded by a newer observation"}
+
+    # Кэш — после коммита: фоновая загрузка, прочитавшая БД до него, уже не перезапишет значение
+    try:
+        pipe = redis.pipeline(transaction=False)
+        pipe.set(key, parking.occupancy, ex=OCCUPANCY_CACHE_TTL)
+        swr_cache.bump_generations([key], pipe)
+        l1_cache.invalidate([key], pipe)
+        pipe.execute()
+    except Exception:
+        pass
+    bbox_cache.invalidate(bbox)
+    occupancy_stream.publish([(id_parking, parking.occupancy, bbox)])
+    return {"message": f"Occupancy for parking ID {id_parking} successfully updated"}
 
 
-@router.get("/parking/{id_parking}/status")
-def get_status(id_parking: int):
-    occupancy = redis.get(f"parking:{id_parking}:occupancy")
-
-    if occupancy is not None:
-        # Данные есть в кэше и они ещё актуальны (TTL не истёк)
-        return {
-            "id_parking": id_parking,
-            "occupancy": int(occupancy),
-            "source": "cache",
-        }
-
-    # Кэш пуст (либо TTL истёк) — берём актуальные данные из БД
+@router.patch("/occupancy")
+def update_occupancy_batch(observations: List[OccupancyObservation]):
+    """
+    Пакетное обновление занятости от контроллера камер: одна запись в БД и один
+    pipeline в Redis на весь запрос. Порядок записей в parkings задаёт время приёма
+    на сервере — те же часы, что у одиночного PATCH и write-behind: пачка, принятая
+    раньше уже сохранённого значения, получает статус "stale". Время камеры
+    observed_at выбирает последнее наблюдение парковки внутри пачки и пишется в
+    историю, поэтому отстающие часы камеры не блокируют её обновления.
+    """
+    if len(observations) > MAX_OCCUPANCY_BATCH:
+        raise HTTPException(status_code=400, detail=f"Too many observations (max {MAX_OCCUPANCY_BATCH})")
+    if not observations:
+        return {"results": []}
+
+    # Из повторов одной парковки в пачке применяем только самое позднее наблюдение
+    latest = {}
+    for obs in observations:
+        current = latest.get(obs.id_parking)
+        if current is None or obs.observed_at > current.observed_at:
+            latest[obs.id_parking] = obs
+
+    received_at = datetime.now(timezone.utc)
     try:
-        row = CvDAO.get_status(id_parking)
+        rows = CvDAO.apply_observations(
+            [(obs.id_parking, obs.occupancy, obs.observed_at, received_at) for obs in latest.values()]
+        )
     except psycopg2.Error:
+        raise HTTPException(status_code=400, detail="Failed to update occupancy")
+
+    statuses = {row[0]: row[1] for row in rows}
+    updated = [obs for obs in latest.values() if statuses.get(obs.id_parking) == "updated"]
+    if updated:
+        try:
+            pipe = redis.pipeline(transaction=False)
+            for obs in updated:
+                pipe.set(f"parking:{obs.id_parking}:occupancy", obs.occupancy, ex=OCCUPANCY_CACHE_TTL)
+            swr_cache.bump_generations([f"parking:{obs.id_parking}:occupancy" for obs in updated], pipe)
+            l1_cache.invalidate([f"parking:{obs.id_parking}:occupancy" for obs in updated], pipe)
+            pipe.execute()
+        except Exception:
+            pass
+        updated_rows = [row for row in rows if row[1] == "updated"]
+        bbox_cache.invalidate(*(row[2:] for row in updated_rows))
+        occupancy_stream.publish((row[0], latest[row[0]].occupancy, row[2:]) for row in updated_rows)
+
+    return {
+        "results": [
+            {
+                "id_parking": obs.id_parking,
+                "status": statuses[obs.id_parking] if latest[obs.id_parking] is obs else "stale",
+            }
+            for obs in observations
+        ]
+    }
+
+
+@router.get("/parking/{id_parking}/status")
+async def get_status(id_parking: int):
+    async def load_occupancy():
+        row = await CvDAO.get_status_async(id_parking)
+        return row[0] if row is not None else None
+
+    # Значение старше OCCUPANCY_CACHE_SOFT_TTL отдаётся из кэша и обновляется в фоне;
+    # при промахе в БД идёт только один запрос на ключ
+    try:
+        occupancy, source = await swr_cache.get_or_load(
+            "occupancy",
+            f"parking:{id_parking}:occupancy",
+            load_occupancy,
+            soft_ttl=OCCUPANCY_CACHE_SOFT_TTL,
+            hard_ttl=OCCUPANCY_CACHE_TTL,
+            decode=int,
+        )
+    except asyncpg.PostgresError:
         raise HTTPException(status_code=500, detail="Database error")
+    except DB_UNAVAILABLE_ERRORS:
+        raise HTTPException(status_code=503, detail="Database unavailable")
 
-    if row is None or row[0] is None:
+    if occupancy is None:
         raise HTTPException(
             status_code=404,
             detail="Parking not found in cache or DB"
         )
 
-    # Кладём свежие данные в кэш с TTL
+    return {
+        "id_parking": id_parking,
+        "occupancy": int(occupancy),
+        "source": "db" if source == "db" else "cache",
+    }
+
+
+@router.get("/parkings/status")
+async def get_statuses(ids: str = Query(..., description="id парковок через запятую")):
+    """
+    Занятость нескольких парковок: сначала L1 процесса, затем один MGET в Redis,
+    один запрос в БД по промахам и один pipeline для заполнения кэша. Порядок
+    items совпадает с ids.
+    """
     try:
-        redis.set(f"parking:{id_parking}:occupancy", row[0], ex=OCCUPANCY_CACHE_TTL)
-    except Exception:
-        pass
+        id_list = list(dict.fromkeys(int(part) for part in ids.split(",") if part.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
+    if len(id_list) > MAX_STATUS_IDS:
+        raise HTTPException(status_code=400, detail=f"Too many ids (max {MAX_STATUS_IDS})")
+    if not id_list:
+        return {"items": [], "not_found": []}
+
+    found = {}
+    for pid in id_list:
+        occupancy = l1_cache.get(f"parking:{pid}:occupancy")
+        if occupancy is not None:
+            found[pid] = (occupancy, "cache")
+
+    remote = [pid for pid in id_list if pid not in found]
+    if remote:
+        try:
+            cached = await async_redis.mget([f"parking:{pid}:occupancy" for pid in remote])
+        except Exception:
+            cached = [None] * len(remote)
+        for pid, occupancy in zip(remote, cached):
+            CACHE_TIER_REQUESTS.labels("redis", "hit" if occupancy is not None else "miss").inc()
+            if occupancy is not None:
+                found[pid] = (int(occupancy), "cache")
+                l1_cache.set(f"parking:{pid}:occupancy", int(occupancy))
+    missing = [pid for pid in id_list if pid not in found]
+
+    if missing:
+        generations = await swr_cache.get_generations([f"parking:{pid}:occupancy" for pid in missing])
+        try:
+            rows = await CvDAO.get_statuses_async(missing)
+        except asyncpg.PostgresError:
+            raise HTTPException(status_code=500, detail="Database error")
+        except DB_UNAVAILABLE_ERRORS:
+            raise HTTPException(status_code=503, detail="Database unavailable")
+
+        rows = [row for row in rows if row[1] is not None]
+        for pid, occupancy in rows:
+            found[pid] = (int(occupancy), "db")
+            l1_cache.set(f"parking:{pid}:occupancy", int(occupancy))
+
+        if rows and generations is not None:
+            expected = dict(zip(missing, generations))
+            try:
+                pipe = async_redis.pipeline(transaction=False)
+                for pid, occupancy in rows:
+                    await swr_cache.set_if_generation(
+                        f"parking:{pid}:occupancy", occupancy, OCCUPANCY_CACHE_TTL, expected[pid], client=pipe
+                    )
+                await pipe.execute()
+            except Exception:
+                pass
 
     return {
-        "id_parking": id_parking,
-        "occupancy": int(row[0]),
-        "source": "db",
-    }
\ No newline at end of file
+        "items": [
+            {"id_parking": pid, "occupancy": found[pid][0], "source": found[pid][1]}
+            for pid in id_list if pid in found
+        ],
+        "not_found": [pid for pid in id_list if pid not in found],
+    }
+
+
+@router.websocket("/occupancy/ws")
+async def occupancy_ws(websocket: WebSocket):
+    """
+    Push изменений занятости. Клиент шлёт {"bbox": [lat_min, lat_max, lon_min, lon_max]}
+    и/или {"ids": [...]}, повторное сообщение заменяет подписку. Сервер шлёт
+    {"updates": [{"id_parking", "occupancy"}, ...]} не чаще раза в PUSH_INTERVAL.
+    """
+    await websocket.accept()
+    OCCUPANCY_STREAM_CONNECTIONS.labels("ws").inc()
+    subscription = occupancy_hub.subscribe()
+
+    async def read_subscriptions():
+        try:
+            while True:
+                message = await websocket.receive_json()
+                try:
+                    bbox, ids = parse_subscription(message.get("bbox"), message.get("ids"))
+                except (AttributeError, ValueError) as e:
+                    await websocket.send_json({"error": str(e)})
+                    continue
+                occupancy_hub.update(subscription, bbox, ids)
+        except (WebSocketDisconnect, json.JSONDecodeError):
+            pass
+        finally:
+            occupancy_hub.unsubscribe(subscription)
+
+    reader = asyncio.create_task(read_subscriptions())
+    try:
+        while not subscription.closed:
+            updates = await subscription.next_batch(HEARTBEAT_INTERVAL)
+            if updates:
+                await websocket.send_json({"updates": updates})
+                await asyncio.sleep(PUSH_INTERVAL)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        reader.cancel()
+        occupancy_hub.unsubscribe(subscription)
+        OCCUPANCY_STREAM_CONNECTIONS.labels("ws").dec()
+
+
+@router.get("/occupancy/stream")
+async def occupancy_sse(
+    request: Request,
+    lat_min: Optional[float] = None,
+    lat_max: Optional[float] = None,
+    lon_min: Optional[float] = None,
+    lon_max: Optional[float] = None,
+    ids: Optional[str] = Query(None, description="id парковок через запятую"),
+):
+    """SSE-вариант /occupancy/ws для клиентов без WebSocket: подписка задаётся параметрами запроса."""
+    bbox = None
+    if None not in (lat_min, lat_max, lon_min, lon_max):
+        bbox = [lat_min, lat_max, lon_min, lon_max]
+    id_list = [part for part in ids.split(",") if part.strip()] if ids else []
+    try:
+        box, id_set = parse_subscription(bbox, id_list)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    subscription = occupancy_hub.subscribe(box, id_set)
+
+    async def events():
+        OCCUPANCY_STREAM_CONNECTIONS.labels("sse").inc()
+        try:
+            while not await request.is_disconnected():
+                updates = await subscription.next_batch(HEARTBEAT_INTERVAL)
+                if not updates:
+                    yield ": ping\n\n"
+                    continue
+                yield f"data: {json.dumps({'updates': updates})}\n\n"
+                await asyncio.sleep(PUSH_INTERVAL)
+        finally:
+            occupancy_hub.unsubscribe(subscription)
+            OCCUPANCY_STREAM_CONNECTIONS.labels("sse").dec()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
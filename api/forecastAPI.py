@@ -0,0 +1,60 @@
+import time
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import AwareDatetime
+from redis.exceptions import RedisError
+
+from forecast import forecast_key, lookup
+from redis_client import async_redis_client as async_redis
+
+router = APIRouter()
+
+# Максимум парковок в одном запросе /parkings/forecast
+MAX_FORECAST_IDS = 500
+
+
+def _at_epoch(at: Optional[AwareDatetime]) -> float:
+    return at.timestamp() if at is not None else time.time()
+
+
+@router.get("/parkings/forecast")
+async def get_forecasts(
+    ids: str = Query(..., description="id парковок через запятую"),
+    at: Optional[AwareDatetime] = None,
+):
+    """Прогноз для видимых парковок одним MGET; парковки без прогноза на этот момент — в missing."""
+    try:
+        id_list = list(dict.fromkeys(int(part) for part in ids.split(",") if part.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
+    if len(id_list) > MAX_FORECAST_IDS:
+        raise HTTPException(status_code=400, detail=f"Too many ids (max {MAX_FORECAST_IDS})")
+    if not id_list:
+        return {"items": [], "missing": []}
+
+    moment = _at_epoch(at)
+    try:
+        cached = await async_redis.mget([forecast_key(pid) for pid in id_list])
+    except RedisError:
+        raise HTTPException(status_code=503, detail="Forecast storage is unavailable")
+    items, missing = [], []
+    for pid, raw in zip(id_list, cached):
+        forecast = lookup(raw, moment)
+        if forecast is None:
+            missing.append(pid)
+        else:
+            items.append({"id_parking": pid, **forecast})
+    return {"items": items, "missing": missing}
+
+
+@router.get("/parkings/{id_parking}/forecast")
+async def get_forecast(id_parking: int, at: Optional[AwareDatetime] = None):
+    try:
+        raw = await async_redis.get(forecast_key(id_parking))
+    except RedisError:
+        raise HTTPException(status_code=503, detail="Forecast storage is unavailable")
+    forecast = lookup(raw, _at_epoch(at))
+    if forecast is None:
+        raise HTTPException(status_code=404, detail="No forecast for this parking and time")
+    return {"id_parking": id_parking, **forecast}
@@ -0,0 +1,84 @@
+from datetime import datetime
+from typing import Literal, Optional
+
+import asyncpg
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import AwareDatetime
+
+from async_database import DB_UNAVAILABLE_ERRORS
+from dao.occupancy_history_dao import OccupancyHistoryDAO
+
+router = APIRouter()
+
+RESOLUTION_SECONDS = {"1m": 60, "1h": 3600, "1d": 86400}
+# Больше точек в одном ответе не отдаём — для длинных диапазонов нужно более грубое разрешение
+MAX_HISTORY_POINTS = 2000
+
+
+def _resolve_range(start: datetime, end: Optional[datetime], resolution: Optional[str]) -> tuple:
+    """
+    Проверяет диапазон и выбирает разрешение: самое подробное, при котором ответ
+    укладывается в MAX_HISTORY_POINTS. Сырые наблюдения эндпоинты не читают вовсе —
+    месячный график собирается из ~720 часовых агрегатов.
+    """
+    end = end or datetime.now(start.tzinfo)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="'to' must be after 'from'")
+    span = (end - start).total_seconds()
+    if resolution is None:
+        resolution = next(
+            (name for name, seconds in RESOLUTION_SECONDS.items() if span / seconds <= MAX_HISTORY_POINTS),
+            "1d",
+        )
+    if span / RESOLUTION_SECONDS[resolution] > MAX_HISTORY_POINTS:
+        raise HTTPException(status_code=400, detail=f"Range too long for resolution {resolution}")
+    return start, end, resolution
+
+
+@router.get("/parkings/{id_parking}/occupancy/history")
+async def get_parking_history(
+    id_parking: int,
+    start: AwareDatetime = Query(..., alias="from"),
+    end: Optional[AwareDatetime] = Query(None, alias="to"),
+    resolution: Optional[Literal["1m", "1h", "1d"]] = None,
+):
+    start, end, resolution = _resolve_range(start, end, resolution)
+    try:
+        rows = await OccupancyHistoryDAO.get_parking_history_async(id_parking, resolution, start, end)
+    except asyncpg.PostgresError:
+        raise HTTPException(status_code=500, detail="Database error")
+    except DB_UNAVAILABLE_ERRORS:
+        raise HTTPException(status_code=503, detail="Database unavailable")
+    return {
+        "id_parking": id_parking,
+        "resolution": resolution,
+        "points": [
+            {"bucket": bucket, "samples": samples, "min": occ_min, "avg": occ_avg, "max": occ_max}
+            for bucket, samples, occ_min, occ_avg, occ_max in rows
+        ],
+    }
+
+
+@router.get("/districts/{district}/occupancy/history")
+async def get_district_history(
+    district: str,
+    start: AwareDatetime = Query(..., alias="from"),
+    end: Optional[AwareDatetime] = Query(None, alias="to"),
+    resolution: Optional[Literal["1m", "1h", "1d"]] = None,
+):
+    """Суммарная занятость парковок района: avg — сумма средних, min/max — границы суммы."""
+    start, end, resolution = _resolve_range(start, end, resolution)
+    try:
+        rows = await OccupancyHistoryDAO.get_district_history_async(district, resolution, start, end)
+    except asyncpg.PostgresError:
+        raise HTTPException(status_code=500, detail="Database error")
+    except DB_UNAVAILABLE_ERRORS:
+        raise HTTPException(status_code=503, detail="Database unavailable")
+    return {
+        "district": district,
+        "resolution": resolution,
+        "points": [
+            {"bucket": bucket, "parkings": parkings, "min": occ_min, "avg": occ_avg, "max": occ_max}
+            for bucket, parkings, occ_min, occ_avg, occ_max in rows
+        ],
+    }
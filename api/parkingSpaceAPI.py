@@ -1,16 +1,45 @@
+import json
+import uuid
+from typing import Literal, Optional
+
 import psycopg2
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 
 from dao.parking_space_dao import ParkingSpaceDAO
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, make_page, resolve_after_id
+from streaming import feature, geojson_response, ndjson_response
 from schemas.parkingSpaceModels import ParkingSpaceCreate, ParkingSpaceUpdate
 
 router = APIRouter()
 
 
+def _row_to_dict(row) -> dict:
+    return {"id": str(row[0]), "coordinates": {"lon": row[1], "lat": row[2]}, "id_parking": row[3]}
+
+
+def _row_to_feature(row) -> str:
+    return feature(
+        json.dumps({"type": "Point", "coordinates": [row[1], row[2]]}),
+        {"id": str(row[0]), "id_parking": row[3]},
+    )
+
+
 @router.get("/parking_spaces/all")
-def get_all_parking_spaces():
+def get_all_parking_spaces(
+    after_id: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    format: Optional[Literal["ndjson", "geojson"]] = None,
+):
+    """Страница парковочных мест; с format=ndjson|geojson — вся таблица потоком."""
+    if format == "ndjson":
+        return ndjson_response(ParkingSpaceDAO.iter_all(), _row_to_dict)
+    if format == "geojson":
+        return geojson_response(ParkingSpaceDAO.iter_all(), _row_to_feature)
+
     try:
-        return ParkingSpaceDAO.get_all()
+        rows = ParkingSpaceDAO.get_all(resolve_after_id(after_id, cursor, uuid.UUID), limit + 1)
+        return make_page(rows, limit, lambda row: row, key=lambda row: row["id"])
     except psycopg2.Error:
         raise HTTPException(status_code=500, detail="Database error")
 
@@ -1,16 +1,30 @@
 import json
+from typing import Literal, Optional
 
+import asyncpg
 import psycopg2
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Response
 
+import bbox_cache
+from async_database import DB_UNAVAILABLE_ERRORS
 from dao.parkings_dao import ParkingsDAO
+from geo import cluster_cell_size, parking_lod, should_cluster, validate_bbox
+from parking_index import parking_index
+from pagination import DEFAULT_PAGE_SIZE, IN_AREA_LIMIT, MAX_PAGE_SIZE, make_page, resolve_after_id, truncate
+from streaming import feature, geojson_response, ndjson_response
+from redis_client import async_redis_client as async_redis
+from tile_cache import bump_layer_version
 from schemas.parkingModels import ParkingCreate, ParkingUpdate
 
 router = APIRouter()
 
+# При live=true берём с запасом кандидатов, т.к. живая занятость может отсеять часть из них
+NEAREST_OVERFETCH = 4
+MAX_NEAREST_K = 100
+
 
 def _row_to_dict(row) -> dict:
-    pid, description, coordinates_json, name, name_obj, adm_area, district, occupancy, all_spaces = row
+    pid, description, coordinates_json, name, name_obj, adm_area, district, occupancy, all_spaces = row[:9]
     return {
         "id": pid,
         "description": description,
@@ -24,33 +38,170 @@ def _row_to_dict(row) -> dict:
     }
 
 
+def _row_to_feature(row) -> str:
+    pid, description, coordinates_json, name, name_obj, adm_area, district, occupancy, all_spaces = row[:9]
+    return feature(coordinates_json, {
+        "id": pid,
+        "name": name,
+        "description": description,
+        "name_obj": name_obj,
+        "adm_area": adm_area,
+        "district": district,
+        "occupancy": occupancy,
+        "all_spaces": all_spaces,
+    })
+
+
+def _cluster_to_dict(row) -> dict:
+    count, all_spaces, free_spaces, lon, lat = row
+    return {
+        "cluster": True,
+        "count": count,
+        "all_spaces": all_spaces,
+        "free_spaces": free_spaces,
+        "coordinates": {"lon": lon, "lat": lat},
+    }
+
+
 @router.get("/parkings/all")
-def get_all_parkings():
+def get_all_parkings(
+    after_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    format: Optional[Literal["ndjson", "geojson"]] = None,
+):
+    """
+    Страница парковок. С format=ndjson или format=geojson вся таблица отдаётся
+    потоком через server-side курсор — память воркера не зависит от размера таблицы.
+    """
+    if format == "ndjson":
+        return ndjson_response(ParkingsDAO.iter_all(), _row_to_dict)
+    if format == "geojson":
+        return geojson_response(ParkingsDAO.iter_all(), _row_to_feature)
+
     try:
-        rows = ParkingsDAO.get_all()
-        return [_row_to_dict(row) for row in rows]
+        rows = ParkingsDAO.get_all(resolve_after_id(after_id, cursor), limit + 1)
+        return make_page(rows, limit, _row_to_dict, key=lambda row: row[0])
     except psycopg2.Error:
         raise HTTPException(status_code=500, detail="Database error")
 
 
 @router.get("/parkings/in_area")
-def get_parkings_in_area(lat_min: float, lat_max: float, lon_min: float, lon_max: float):
+async def get_parkings_in_area(
+    lat_min: float,
+    lat_max: float,
+    lon_min: float,
+    lon_max: float,
+    zoom: Optional[int] = Query(None, ge=0, le=22),
+    format: Optional[Literal["geojson"]] = None,
+):
+    """
+    Парковки в видимой области карты. Если передан zoom мельче CLUSTER_MAX_ZOOM,
+    вместо полигонов возвращаются кластеры с количеством, суммой мест и центроидом,
+    иначе по zoom выбирается упрощённая геометрия (geo.PARKING_LODS). Ответ берётся
+    из in-memory индекса parking_index, а пока он не готов — из ячеек кэша
+    bbox_cache. В ответе не больше IN_AREA_LIMIT объектов, при обрезке truncated=True.
+
+    format=geojson — быстрый путь: FeatureCollection полигонов (без кластеризации)
+    целиком строится в PostGIS и отдаётся байтами как есть.
+    """
     try:
-        rows = ParkingsDAO.get_in_area(lat_min, lat_max, lon_min, lon_max)
-        return [_row_to_dict(row) for row in rows]
-    except psycopg2.Error:
+        validate_bbox(lat_min, lat_max, lon_min, lon_max)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        if format == "geojson":
+            body = await ParkingsDAO.get_in_area_geojson_async(
+                lat_min, lat_max, lon_min, lon_max, zoom, IN_AREA_LIMIT
+            )
+            return Response(content=body, media_type="application/geo+json")
+
+        if should_cluster(zoom):
+            cell_size = cluster_cell_size(zoom, lat_min, lat_max, lon_min, lon_max)
+            rows = await ParkingsDAO.get_clusters_async(lat_min, lat_max, lon_min, lon_max, cell_size)
+            return truncate([_cluster_to_dict(row) for row in rows])
+
+        body = parking_index.in_area_json(lat_min, lat_max, lon_min, lon_max, zoom, IN_AREA_LIMIT)
+        if body is not None:
+            return Response(content=body, media_type="application/json")
+
+        async def load(*bbox):
+            return await ParkingsDAO.get_in_area_async(*bbox, zoom)
+
+        column, _ = parking_lod(zoom)
+        items = await bbox_cache.get_in_area(
+            column, lat_min, lat_max, lon_min, lon_max, loader=load, to_item=_row_to_dict
+        )
+        if items is not None:
+            items.sort(key=lambda item: item["id"])
+            return truncate(items)
+
+        rows = await ParkingsDAO.get_in_area_async(
+            lat_min, lat_max, lon_min, lon_max, zoom, limit=IN_AREA_LIMIT + 1
+        )
+        return truncate([_row_to_dict(row) for row in rows])
+    except asyncpg.PostgresError:
+        raise HTTPException(status_code=500, detail="Database error")
+    except DB_UNAVAILABLE_ERRORS:
+        raise HTTPException(status_code=503, detail="Database unavailable")
+
+
+@router.get("/parkings/nearest")
+async def get_nearest_parkings(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    k: int = Query(10, ge=1, le=MAX_NEAREST_K),
+    min_free: int = Query(1, ge=0),
+    live: bool = False,
+):
+    """
+    Ближайшие парковки, где свободно не меньше min_free мест (all_spaces - occupancy),
+    отсортированные по расстоянию. live=true подменяет occupancy из БД значениями
+    из Redis, которые пишет cv/occupancy.
+    """
+    try:
+        if not live:
+            rows = await ParkingsDAO.get_nearest_async(lat, lon, k, min_free)
+            occupancies = [row[7] for row in rows]
+        else:
+            rows = await ParkingsDAO.get_nearest_async(lat, lon, k * NEAREST_OVERFETCH, min_free, exact_free=False)
+            try:
+                cached = await async_redis.mget([f"parking:{row[0]}:occupancy" for row in rows]) if rows else []
+            except Exception:
+                cached = [None] * len(rows)
+            occupancies = [int(c) if c is not None else row[7] for row, c in zip(rows, cached)]
+    except asyncpg.PostgresError:
         raise HTTPException(status_code=500, detail="Database error")
+    except DB_UNAVAILABLE_ERRORS:
+        raise HTTPException(status_code=503, detail="Database unavailable")
+
+    result = []
+    for row, occupancy in zip(rows, occupancies):
+        free_spaces = max((row[8] or 0) - (occupancy or 0), 0)
+        if free_spaces < min_free:
+            continue
+        item = _row_to_dict(row)
+        item["occupancy"] = occupancy
+        item["free_spaces"] = free_spaces
+        item["distance_m"] = row[9]
+        result.append(item)
+        if len(result) == k:
+            break
+    return result
 
 
 @router.get("/parking/{parking_id}")
-def get_parking(parking_id: int):
+async def get_parking(parking_id: int):
     try:
-        row = ParkingsDAO.get_by_id(parking_id)
+        row = await ParkingsDAO.get_by_id_async(parking_id)
         if row is None:
             raise HTTPException(status_code=404, detail="Parking not found")
         return _row_to_dict(row)
-    except psycopg2.Error:
+    except asyncpg.PostgresError:
         raise HTTPException(status_code=500, detail="Database error")
+    except DB_UNAVAILABLE_ERRORS:
+        raise HTTPException(status_code=503, detail="Database unavailable")
 
 
 @router.get("/parking_fields/{parking_id}")
@@ -66,28 +217,12 @@ def get_parking_fields(parking_id: int, fields: str):
 
 
 @router.get("/parkinggeojson/{parking_id}")
-def get_parking_geojson(parking_id: int):
+def get_parking_geojson(parking_id: int, zoom: Optional[int] = Query(None, ge=0, le=22)):
     try:
-        row = ParkingsDAO.get_geojson(parking_id)
-        if row is None:
+        body = ParkingsDAO.get_geojson(parking_id, zoom)
+        if body is None:
             return {"error": "Parking not found"}
-
-        pid, description, coordinates_json, name, name_obj, adm_area, district, occupancy, all_spaces = row
-
-        return {
-            "type": "Feature",
-            "geometry": json.loads(coordinates_json),
-            "properties": {
-                "id": pid,
-                "name": name,
-                "description": description,
-                "name_obj": name_obj,
-                "adm_area": adm_area,
-                "district": district,
-                "occupancy": occupancy,
-                "all_spaces": all_spaces
-            },
-        }
+        return Response(content=body, media_type="application/geo+json")
     except psycopg2.Error:
         raise HTTPException(status_code=500, detail="Database error")
 
@@ -106,7 +241,9 @@ def create_parking(parking: ParkingCreate):
             occupancy=parking.occupancy,
             all_spaces=parking.all_spaces,
         )
-        pid, name, coordinates_json = row
+        bump_layer_version("parkings")
+        bbox_cache.invalidate(row[3:7])
+        pid, name, coordinates_json = row[:3]
         return {"id": pid, "name": name, "coordinates": json.loads(coordinates_json)}
     except psycopg2.Error:
         raise HTTPException(status_code=500, detail="Database error")
@@ -153,8 +290,10 @@ def update_parking(parking_id: int, parking: ParkingUpdate):
 
     try:
         updated = ParkingsDAO.update(updates, params)
+        bump_layer_version("parkings")
+        bbox_cache.invalidate(updated[3:7], updated[7:11])
         fields = ["id", "name", "occupancy"]
-        return dict(zip(fields, updated))
+        return dict(zip(fields, updated[:3]))
     except psycopg2.Error:
         raise HTTPException(status_code=500, detail="Database error")
 
@@ -163,6 +302,8 @@ def update_parking(parking_id: int, parking: ParkingUpdate):
 def delete_parking(parking_id: int):
     try:
         deleted = ParkingsDAO.delete(parking_id)
+        bump_layer_version("parkings")
+        bbox_cache.invalidate(deleted[1:5])
         return {"status": "deleted", "id": deleted[0]}
     except psycopg2.Error:
         raise HTTPException(status_code=500, detail="Database error")
\ No newline at end of file
@@ -1,8 +1,17 @@
-from fastapi import APIRouter, HTTPException
+import json
+from typing import Literal, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+import asyncpg
 import psycopg2
 
+from async_database import DB_UNAVAILABLE_ERRORS
 from dao.sim_stops_dao import SimStopsDAO
+from geo import cluster_cell_size, should_cluster
+from pagination import DEFAULT_PAGE_SIZE, IN_AREA_LIMIT, MAX_PAGE_SIZE, make_page, resolve_after_id, truncate
+from streaming import feature, geojson_response, ndjson_response
 from schemas.simStopsModels import SIMStopCreate, SIMStopUpdate
+from tile_cache import bump_layer_version
 
 router = APIRouter()
 
@@ -19,31 +28,73 @@ def _row_to_dict(row) -> dict:
     }
 
 
+def _row_to_feature(row) -> str:
+    id, description, lon, lat, adm_area, district, free_sims = row
+    return feature(json.dumps({"type": "Point", "coordinates": [lon, lat]}), {
+        "id": id,
+        "description": description,
+        "adm_area": adm_area,
+        "district": district,
+        "free_sims": free_sims,
+    })
+
+
+def _cluster_to_dict(row) -> dict:
+    count, free_sims, lon, lat = row
+    return {
+        "cluster": True,
+        "count": count,
+        "free_sims": free_sims,
+        "coordinates": {"lon": lon, "lat": lat},
+    }
+
+
 @router.get("/sim_stops/all")
-def get_all_sim_stops():
+def get_all_sim_stops(
+    after_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    format: Optional[Literal["ndjson", "geojson"]] = None,
+):
+    """Страница остановок СИМ; с format=ndjson|geojson — вся таблица потоком."""
+    if format == "ndjson":
+        return ndjson_response(SimStopsDAO.iter_all(), _row_to_dict)
+    if format == "geojson":
+        return geojson_response(SimStopsDAO.iter_all(), _row_to_feature)
+
     try:
-        rows = SimStopsDAO.get_all()
-        return [_row_to_dict(row) for row in rows]
+        rows = SimStopsDAO.get_all(resolve_after_id(after_id, cursor), limit + 1)
+        return make_page(rows, limit, _row_to_dict, key=lambda row: row[0])
     except psycopg2.Error:
         raise HTTPException(status_code=500, detail="Database error")
 
 
 @router.get("/sim_stops/in_area")
-def get_in_area(
+async def get_in_area(
     min_lat: float,
     max_lat: float,
     min_lon: float,
     max_lon: float,
+    zoom: Optional[int] = Query(None, ge=0, le=22),
 ):
     """
     Поиск остановок СИМ в прямоугольной зоне видимости карты.
     Параметры — границы видимой области: min_lat, max_lat, min_lon, max_lon.
+    При zoom мельче CLUSTER_MAX_ZOOM возвращаются кластеры остановок.
+    В ответе не больше IN_AREA_LIMIT объектов, при обрезке truncated=True.
     """
     try:
-        rows = SimStopsDAO.get_in_area(min_lat, max_lat, min_lon, max_lon)
-        return [_row_to_dict(row) for row in rows]
-    except psycopg2.Error:
+        if should_cluster(zoom):
+            cell_size = cluster_cell_size(zoom, min_lat, max_lat, min_lon, max_lon)
+            rows = await SimStopsDAO.get_clusters_async(min_lat, max_lat, min_lon, max_lon, cell_size)
+            return truncate([_cluster_to_dict(row) for row in rows])
+
+        rows = await SimStopsDAO.get_in_area_async(min_lat, max_lat, min_lon, max_lon, limit=IN_AREA_LIMIT + 1)
+        return truncate([_row_to_dict(row) for row in rows])
+    except asyncpg.PostgresError:
         raise HTTPException(status_code=500, detail="Database error")
+    except DB_UNAVAILABLE_ERRORS:
+        raise HTTPException(status_code=503, detail="Database unavailable")
 
 
 @router.get("/sim_stops/{stop_id}")
@@ -68,6 +119,7 @@ def create_sim_stop(sim_stop: SIMStopCreate):
             district=sim_stop.district,
             free_sims=sim_stop.free_sims,
         )
+        bump_layer_version("sim_stops")
         return _row_to_dict(row)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -79,6 +131,7 @@ def update_sim_stop(stop_id: int, sim_stop: SIMStopUpdate):
         row = SimStopsDAO.update(stop_id, sim_stop)
         if row is None:
             raise HTTPException(status_code=404, detail="SIM stop not found")
+        bump_layer_version("sim_stops")
         return _row_to_dict(row)
     except psycopg2.Error:
         raise HTTPException(status_code=500, detail="Database error")
@@ -90,6 +143,7 @@ def delete_sim_stop(stop_id: int):
         deleted = SimStopsDAO.delete(stop_id)
         if deleted is None:
             raise HTTPException(status_code=404, detail="SIM stop not found")
+        bump_layer_version("sim_stops")
         return {"status": "deleted", "id": deleted[0]}
     except psycopg2.Error:
         raise HTTPException(status_code=500, detail="Database error")
\ No newline at end of file
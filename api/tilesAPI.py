@@ -0,0 +1,45 @@
+import hashlib
+
+import asyncpg
+from fastapi import APIRouter, HTTPException, Request, Response
+
+import tile_cache
+from async_database import DB_UNAVAILABLE_ERRORS
+from dao.tiles_dao import TILE_LAYERS, TilesDAO
+
+router = APIRouter()
+
+MAX_TILE_ZOOM = 22
+TILE_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+# Тайл может устареть не больше чем на это время у клиента/CDN после изменения слоя
+TILE_CLIENT_MAX_AGE = 60
+
+
+@router.get("/tiles/{layer}/{z}/{x}/{y}.pbf")
+async def get_tile(layer: str, z: int, x: int, y: int, request: Request):
+    if layer not in TILE_LAYERS:
+        raise HTTPException(status_code=404, detail="Unknown layer")
+    if not 0 <= z <= MAX_TILE_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=400, detail="Invalid tile coordinates")
+
+    version = await tile_cache.get_layer_version(layer)
+    tile = await tile_cache.get_tile(layer, version, z, x, y)
+    if tile is None:
+        try:
+            tile = await TilesDAO.get_tile(layer, z, x, y)
+        except asyncpg.PostgresError:
+            raise HTTPException(status_code=500, detail="Database error")
+        except DB_UNAVAILABLE_ERRORS:
+            raise HTTPException(status_code=503, detail="Database unavailable")
+        await tile_cache.set_tile(layer, version, z, x, y, tile)
+
+    # ETag — хэш содержимого: занятость меняет тайл парковок, не меняя версию слоя
+    etag = f'"{hashlib.blake2b(tile, digest_size=16).hexdigest()}"'
+    headers = {
+        "Cache-Control": f"public, max-age={TILE_CLIENT_MAX_AGE}",
+        "ETag": etag,
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=tile, media_type=TILE_MEDIA_TYPE, headers=headers)
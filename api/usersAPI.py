@@ -1,19 +1,36 @@
+import json
+from typing import Literal, Optional
+
 import psycopg2
-from fastapi import APIRouter, HTTPException
-from passlib.context import CryptContext
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 
+from auth import revoke_user_tokens
 from dao.users_dao import UsersDAO
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, make_page, resolve_after_id
+from streaming import ndjson_response
+import user_import
+from password_hashing import hash_password, hash_passwords
 from schemas.userModels import UserCreate, UserUpdate
 
 router = APIRouter()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 
 @router.get("/users/all")
-def get_all_users():
+def get_all_users(
+    after_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    format: Optional[Literal["ndjson"]] = None,
+):
+    """Страница пользователей; с format=ndjson — вся таблица потоком."""
+    if format == "ndjson":
+        return ndjson_response(UsersDAO.iter_all(), lambda row: row)
+
     try:
-        return UsersDAO.get_all()
+        rows = UsersDAO.get_all(resolve_after_id(after_id, cursor), limit + 1)
+        return make_page(rows, limit, lambda row: row, key=lambda row: row[0])
     except psycopg2.Error:
         raise HTTPException(status_code=500, detail="Database error")
 
@@ -43,16 +60,102 @@ def get_user_fields(user_id: int, fields: str):
 
 
 @router.post("/users")
-def create_user(user: UserCreate):
+async def create_user(user: UserCreate):
+    hashed_password = await hash_password(user.password_hash)
     try:
-        hashed_password = pwd_context.hash(user.password_hash)
-        created_user = UsersDAO.create(user.email, hashed_password, user.phone_number, user.subscription_status)
+        created_user = await run_in_threadpool(
+            UsersDAO.create, user.email, hashed_password, user.phone_number, user.subscription_status
+        )
         fields = ["id", "email", "phone_number", "subscription_status"]
         return dict(zip(fields, created_user))
     except psycopg2.Error:
         raise HTTPException(status_code=500, detail="Database error")
 
 
+async def _read_import_body(request: Request) -> str:
+    """Тело импорта не больше MAX_IMPORT_BODY_BYTES: лишнее не читается в память."""
+    too_large = HTTPException(
+        status_code=413, detail=f"Import body is limited to {user_import.MAX_IMPORT_BODY_BYTES} bytes"
+    )
+    try:
+        declared = int(request.headers.get("content-length", 0))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Content-Length")
+    if declared > user_import.MAX_IMPORT_BODY_BYTES:
+        raise too_large
+
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > user_import.MAX_IMPORT_BODY_BYTES:
+            raise too_large
+        chunks.append(chunk)
+    try:
+        return b"".join(chunks).decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Body must be UTF-8")
+
+
+async def _import_batches(rows: list, errors: list):
+    """
+    Хэширует и вставляет строки пачками по IMPORT_BATCH_ROWS, каждая — своей
+    транзакцией, и после каждой отдаёт строку прогресса. Обрыв запроса теряет
+    только текущую пачку.
+    """
+    created = 0
+    for start in range(0, len(rows), user_import.IMPORT_BATCH_ROWS):
+        batch = rows[start:start + user_import.IMPORT_BATCH_ROWS]
+        try:
+            hashes = await hash_passwords([password for _, _, password, _, _ in batch])
+            inserted = await run_in_threadpool(UsersDAO.import_users, [
+                (email, phone, password_hash, subscription)
+                for (_, email, _, phone, subscription), password_hash in zip(batch, hashes)
+            ])
+        except psycopg2.Error:
+            yield json.dumps({"error": "Database error", "processed": start, "created": created}) + "\n"
+            return
+        created += len(inserted)
+        # Email, занятые параллельно с импортом, вставка пропустила
+        errors.extend(
+            {"row": number, "email": email, "error": "Email already exists"}
+            for number, email, *_ in batch if email not in inserted
+        )
+        yield json.dumps({"processed": start + len(batch), "total": len(rows), "created": created}) + "\n"
+
+    errors.sort(key=lambda error: error["row"])
+    yield json.dumps({"created": created, "errors": errors}, ensure_ascii=False) + "\n"
+
+
+@router.post("/users/import")
+async def import_users(request: Request, format: Optional[Literal["csv", "ndjson"]] = None):
+    """
+    Массовое создание пользователей из тела запроса: CSV с заголовком
+    (email,password,phone_number,subscription_status) или NDJSON с теми же полями.
+    Формат берётся из format или Content-Type. Проверка дубликатов — один запрос
+    на весь файл, затем пачки: пароли хэшируются в пуле процессов, вставка — COPY
+    во временную таблицу и один INSERT с коммитом на пачку.
+
+    Ответ — NDJSON: строка прогресса ({"processed", "total", "created"}) после
+    каждой пачки и итоговая строка {"created", "errors"} с ошибками по номерам строк.
+    """
+    fmt = format or ("ndjson" if "ndjson" in request.headers.get("content-type", "") else "csv")
+    body = await _read_import_body(request)
+
+    rows, errors = user_import.parse(body, fmt)
+    if rows:
+        try:
+            existing = await run_in_threadpool(UsersDAO.find_existing_emails, [row[1] for row in rows])
+        except psycopg2.Error:
+            raise HTTPException(status_code=500, detail="Database error")
+        errors.extend(
+            {"row": number, "email": email, "error": "Email already exists"}
+            for number, email, *_ in rows if email in existing
+        )
+        rows = [row for row in rows if row[1] not in existing]
+
+    return StreamingResponse(_import_batches(rows, errors), media_type="application/x-ndjson")
+
+
 @router.put("/user/{user_id}")
 def update_user(user_id: int, user: UserUpdate):
     updates = []
@@ -86,6 +189,7 @@ def delete_user(user_id: int):
         deleted = UsersDAO.delete(user_id)
         if deleted is None:
             raise HTTPException(status_code=404, detail="User not found")
+        revoke_user_tokens(user_id)
     except psycopg2.Error:
         raise HTTPException(status_code=400, detail="Failed to delete user")
 
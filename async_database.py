@@ -0,0 +1,55 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import asyncpg
+
+from config import get_settings
+from database import get_database_url
+
+
+# Сбои доступа к БД, а не ошибки запроса: пул не выдал соединение за таймаут,
+# соединение разорвано или закрыто. Обработчики отвечают на них 503
+DB_UNAVAILABLE_ERRORS = (asyncio.TimeoutError, OSError, asyncpg.InterfaceError)
+
+_pool: Optional[asyncpg.Pool] = None
+# Пул создаётся один раз, даже если первые запросы пришли одновременно
+_pool_lock = asyncio.Lock()
+
+
+async def init_async_pool() -> asyncpg.Pool:
+    """
+    Создает asyncpg-пул для async-обработчиков. Вызывается при старте приложения и
+    лениво из get_async_connection: если при старте БД была недоступна, пул
+    создаст первый запрос после её появления.
+    """
+    global _pool
+    if _pool is not None:
+        return _pool
+    async with _pool_lock:
+        if _pool is None:
+            settings = get_settings()
+            _pool = await asyncpg.create_pool(
+                dsn=get_database_url(),
+                min_size=settings.async_db_pool_min_size,
+                max_size=settings.async_db_pool_max_size,
+                # Закрывать соединения, простаивающие дольше этого времени
+                max_inactive_connection_lifetime=settings.async_db_pool_idle_timeout,
+            )
+    return _pool
+
+
+async def close_async_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+@asynccontextmanager
+async def get_async_connection():
+    """Асинхронный аналог database.get_db_connection: выдает соединение из asyncpg-пула."""
+    pool = await init_async_pool()
+    settings = get_settings()
+    async with pool.acquire(timeout=settings.db_pool_acquire_timeout) as conn:
+        yield conn
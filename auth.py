@@ -1,15 +1,68 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
+from typing import Optional
 
 import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from prometheus_client import Counter
 
 from config import get_settings
+from redis_client import async_redis_client as async_redis
+from redis_client import redis_client as redis
+
+logger = logging.getLogger(__name__)
 
 bearer_scheme = HTTPBearer()
 
+# Проверенные access-токены: sha256 токена -> (user_id, exp)
+TOKEN_CACHE_SIZE = 10000
+TOKEN_REVOCATION_CHANNEL = "auth:revoke"
+TOKEN_CACHE_REQUESTS = Counter("auth_token_cache_requests_total", "Проверки access-токена через кэш", ["result"])
+
+
+class _TokenCache:
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE):
+        self._max_size = max_size
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest: bytes) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            user_id, exp = entry
+            if exp <= time.time():
+                del self._entries[digest]
+                return None
+            self._entries.move_to_end(digest)
+            return user_id
+
+    def put(self, digest: bytes, user_id: int, exp: float):
+        with self._lock:
+            self._entries[digest] = (user_id, exp)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def drop_user(self, user_id: int):
+        with self._lock:
+            for digest in [d for d, (uid, _) in self._entries.items() if uid == user_id]:
+                del self._entries[digest]
+
+
+_token_cache = _TokenCache()
+
 
 def _create_token(user_id: int, token_type: str, expires_delta: timedelta) -> str:
     settings = get_settings()
@@ -39,7 +92,8 @@ def create_refresh_token(user_id: int) -> str:
     )
 
 
-def _decode_token(token: str, token_type: str) -> int:
+def _decode_claims(token: str, token_type: str) -> tuple:
+    """Проверяет подпись и тип токена, возвращает (user_id, exp)."""
     settings = get_settings()
     try:
         payload = jwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_algorithm])
@@ -52,15 +106,61 @@ def _decode_token(token: str, token_type: str) -> int:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token type")
 
     try:
-        return int(payload.get("sub", ""))
-    except ValueError:
+        return int(payload.get("sub", "")), payload["exp"]
+    except (ValueError, KeyError):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token subject")
 
 
+def _decode_token(token: str, token_type: str) -> int:
+    return _decode_claims(token, token_type)[0]
+
+
 def get_current_user_id(
     credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
 ) -> int:
-    return _decode_token(credentials.credentials, "access")
+    """
+    Один и тот же access-токен клиент присылает сотни раз, поэтому проверенные
+    токены кэшируются до их exp: повторная проверка — поиск по sha256 без HMAC и
+    разбора claims.
+    """
+    token = credentials.credentials
+    digest = hashlib.sha256(token.encode()).digest()
+    user_id = _token_cache.get(digest)
+    if user_id is not None:
+        TOKEN_CACHE_REQUESTS.labels("hit").inc()
+        return user_id
+
+    TOKEN_CACHE_REQUESTS.labels("miss").inc()
+    user_id, exp = _decode_claims(token, "access")
+    _token_cache.put(digest, user_id, exp)
+    return user_id
+
+
+def revoke_user_tokens(user_id: int):
+    """Убирает проверенные токены пользователя из кэша во всех процессах."""
+    _token_cache.drop_user(user_id)
+    try:
+        redis.publish(TOKEN_REVOCATION_CHANNEL, json.dumps({"user_id": user_id}))
+    except Exception:
+        logger.exception("Token revocation publish failed")
+
+
+async def listen_token_revocations():
+    """Фоновая задача процесса: применяет отзывы токенов, опубликованные другими процессами."""
+    while True:
+        pubsub = async_redis.pubsub()
+        try:
+            await pubsub.subscribe(TOKEN_REVOCATION_CHANNEL)
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    _token_cache.drop_user(json.loads(message["data"])["user_id"])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Token revocation listener failed, reconnecting")
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
 
 
 def decode_refresh_token(refresh_token: str) -> int:
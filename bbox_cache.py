@@ -0,0 +1,134 @@
+"""
+Кэш результатов /parkings/in_area по ячейкам фиксированной сетки.
+
+Запрошенный bbox раскладывается на ячейки CELL_SIZE x CELL_SIZE градусов. Для каждой
+ячейки в Redis хранится список парковок, чей bbox её пересекает, вместе с этим bbox —
+ответ собирается из ячеек и фильтруется по запрошенной области. Записи в парковки
+сбрасывают ровно те ячейки, которые задевает старая и новая геометрия, и меняют их
+поколение (swr_cache.bump_generations): загрузка, прочитавшая БД до записи, не
+вернёт в ячейку старые строки.
+"""
+import json
+import math
+from typing import Awaitable, Callable, Iterable, List, Optional
+
+import swr_cache
+from geo import PARKING_LODS, grid_cell_count
+from redis_client import async_redis_client as async_redis
+from redis_client import redis_client as redis
+
+
+CELL_SIZE = 0.01
+CELL_CACHE_TTL = 300
+# Больше ячеек за запрос не кэшируем — такой bbox дешевле отдать одним запросом в БД
+MAX_CACHED_CELLS = 64
+
+
+def _cell_key(column: str, cx: int, cy: int) -> str:
+    return f"parkings:cells:{column}:{cx}:{cy}"
+
+
+def cells_for_bbox(lat_min: float, lat_max: float, lon_min: float, lon_max: float) -> List[tuple]:
+    x0, x1 = math.floor(lon_min / CELL_SIZE), math.floor(lon_max / CELL_SIZE)
+    y0, y1 = math.floor(lat_min / CELL_SIZE), math.floor(lat_max / CELL_SIZE)
+    return [(cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)]
+
+
+def _intersects(bbox, lat_min: float, lat_max: float, lon_min: float, lon_max: float) -> bool:
+    xmin, ymin, xmax, ymax = bbox
+    return xmin <= lon_max and xmax >= lon_min and ymin <= lat_max and ymax >= lat_min
+
+
+async def get_in_area(
+    column: str,
+    lat_min: float,
+    lat_max: float,
+    lon_min: float,
+    lon_max: float,
+    loader: Callable[[float, float, float, float], Awaitable[Iterable]],
+    to_item: Callable,
+) -> Optional[List[dict]]:
+    """
+    Собирает ответ in_area из ячеек кэша, догружая промахи одним запросом loader
+    по объединённому bbox недостающих ячеек. loader возвращает строки, последние
+    четыре поля которых — xmin, ymin, xmax, ymax геометрии.
+
+    Возвращает None, если bbox слишком большой для кэширования.
+    """
+    # Число ячеек — до построения их списка: огромный bbox не должен его материализовать
+    if grid_cell_count(lon_min, lat_min, lon_max, lat_max, CELL_SIZE) > MAX_CACHED_CELLS:
+        return None
+    cells = cells_for_bbox(lat_min, lat_max, lon_min, lon_max)
+
+    keys = [_cell_key(column, cx, cy) for cx, cy in cells]
+    try:
+        cached = await async_redis.mget(keys)
+    except Exception:
+        cached = [None] * len(keys)
+
+    entries = {}
+    missing = []
+    for cell, raw in zip(cells, cached):
+        if raw is None:
+            missing.append(cell)
+            continue
+        for bbox, item in json.loads(raw):
+            entries[item["id"]] = (bbox, item)
+
+    if missing:
+        m_lon_min = min(cx for cx, _ in missing) * CELL_SIZE
+        m_lon_max = (max(cx for cx, _ in missing) + 1) * CELL_SIZE
+        m_lat_min = min(cy for _, cy in missing) * CELL_SIZE
+        m_lat_max = (max(cy for _, cy in missing) + 1) * CELL_SIZE
+        # Поколения ячеек — до запроса в БД: invalidate после него их сменит
+        generations = await swr_cache.get_generations([_cell_key(column, cx, cy) for cx, cy in missing])
+        rows = await loader(m_lat_min, m_lat_max, m_lon_min, m_lon_max)
+
+        filled = {cell: [] for cell in missing}
+        for row in rows:
+            bbox = list(row[-4:])
+            item = to_item(row)
+            entries[item["id"]] = (bbox, item)
+            for cell in cells_for_bbox(bbox[1], bbox[3], bbox[0], bbox[2]):
+                if cell in filled:
+                    filled[cell].append((bbox, item))
+
+        if generations is not None:
+            try:
+                pipe = async_redis.pipeline(transaction=False)
+                for (cx, cy), generation in zip(missing, generations):
+                    await swr_cache.set_if_generation(
+                        _cell_key(column, cx, cy), json.dumps(filled[(cx, cy)]), CELL_CACHE_TTL, generation,
+                        client=pipe,
+                    )
+                await pipe.execute()
+            except Exception:
+                pass
+
+    return [
+        item for bbox, item in entries.values()
+        if _intersects(bbox, lat_min, lat_max, lon_min, lon_max)
+    ]
+
+
+def invalidate(*bboxes):
+    """
+    Сбрасывает ячейки всех уровней детализации, которые задевают переданные
+    bbox (xmin, ymin, xmax, ymax). None пропускаются — удобно для старой/новой геометрии.
+    """
+    keys = []
+    for bbox in bboxes:
+        if bbox is None or any(v is None for v in bbox):
+            continue
+        xmin, ymin, xmax, ymax = bbox
+        for cx, cy in cells_for_bbox(ymin, ymax, xmin, xmax):
+            keys.extend(_cell_key(column, cx, cy) for _, column, _, _ in PARKING_LODS)
+    if not keys:
+        return
+    try:
+        pipe = redis.pipeline(transaction=False)
+        swr_cache.bump_generations(keys, pipe)
+        pipe.delete(*keys)
+        pipe.execute()
+    except Exception:
+        pass
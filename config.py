@@ -14,7 +14,29 @@ class Settings(BaseSettings):
     db_password: str = Field(default="dxUVHnV0sqULLO73J2dxZETqne4feSK9", alias="DB_PASSWORD")
     db_host: str = Field(default="localhost", alias="DB_HOST")
     db_port: str = Field(default="5432", alias="DB_PORT")
+    db_pool_min_size: int = Field(default=2, alias="DB_POOL_MIN_SIZE")
+    db_pool_max_size: int = Field(default=20, alias="DB_POOL_MAX_SIZE")
+    db_pool_acquire_timeout: float = Field(default=5.0, alias="DB_POOL_ACQUIRE_TIMEOUT")
+    db_pool_max_lifetime: float = Field(default=1800.0, alias="DB_POOL_MAX_LIFETIME")
+    db_pool_health_check_idle: float = Field(default=30.0, alias="DB_POOL_HEALTH_CHECK_IDLE")
+    async_db_pool_min_size: int = Field(default=2, alias="ASYNC_DB_POOL_MIN_SIZE")
+    async_db_pool_max_size: int = Field(default=20, alias="ASYNC_DB_POOL_MAX_SIZE")
+    async_db_pool_idle_timeout: float = Field(default=300.0, alias="ASYNC_DB_POOL_IDLE_TIMEOUT")
     redis_url: Optional[str] = Field(default=None, alias="REDIS_URL")
+    occupancy_write_behind: bool = Field(default=False, alias="OCCUPANCY_WRITE_BEHIND")
+    occupancy_flush_interval_ms: int = Field(default=500, alias="OCCUPANCY_FLUSH_INTERVAL_MS")
+    parking_snapshot_path: Optional[str] = Field(default=None, alias="PARKING_SNAPSHOT_PATH")
+    forecast_in_app: bool = Field(default=False, alias="FORECAST_IN_APP")
+    password_hash_workers: int = Field(default=2, alias="PASSWORD_HASH_WORKERS")
+    password_hash_max_pending: int = Field(default=64, alias="PASSWORD_HASH_MAX_PENDING")
+    password_hash_timeout: float = Field(default=5.0, alias="PASSWORD_HASH_TIMEOUT")
+    login_throttle_enabled: bool = Field(default=True, alias="LOGIN_THROTTLE_ENABLED")
+    login_email_burst: int = Field(default=10, alias="LOGIN_EMAIL_BURST")
+    login_email_per_minute: float = Field(default=5.0, alias="LOGIN_EMAIL_PER_MINUTE")
+    login_ip_burst: int = Field(default=50, alias="LOGIN_IP_BURST")
+    login_ip_per_minute: float = Field(default=30.0, alias="LOGIN_IP_PER_MINUTE")
+    # Сколько доверенных прокси (балансировщик Render и т.п.) дописывают X-Forwarded-For перед приложением
+    trusted_proxy_hops: int = Field(default=0, alias="TRUSTED_PROXY_HOPS")
     jwt_secret: str = Field(default="change_me", alias="JWT_SECRET")
     jwt_algorithm: str = Field(default="HS256", alias="JWT_ALG")
     jwt_access_expires_minutes: int = Field(default=15, alias="JWT_ACCESS_EXPIRES_MIN")
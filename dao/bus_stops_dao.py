@@ -40,7 +40,8 @@ class BusStopsDAO:
 
     @staticmethod
     def get_in_area(lat_min: float, lat_max: float,
-                    lon_min: float, lon_max: float) -> List[Tuple]:
+                    lon_min: float, lon_max: float,
+                    limit: Optional[int] = None) -> List[Tuple]:
         with get_db_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("""
@@ -54,7 +55,9 @@ class BusStopsDAO:
                     FROM bus_stops
                     WHERE coordinates && ST_MakeEnvelope(%s, %s, %s, %s, 4326)
                       AND ST_Within(coordinates, ST_MakeEnvelope(%s, %s, %s, %s, 4326))
-                """, (lon_min, lat_min, lon_max, lat_max, lon_min, lat_min, lon_max, lat_max))
+                    ORDER BY id
+                    LIMIT %s
+                """, (lon_min, lat_min, lon_max, lat_max, lon_min, lat_min, lon_max, lat_max, limit))
                 return cur.fetchall()
 
     @staticmethod
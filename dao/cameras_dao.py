@@ -1,19 +1,32 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 from psycopg2._json import Json
 
-from database import get_db_connection
+from database import get_db_connection, iter_query
 
 
 class CamerasDAO:
 
     @staticmethod
-    def get_all():
+    def get_all(after_id: Optional[int] = None, limit: int = 100):
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("SELECT id, description, cv_data FROM cameras;")
+                cur.execute(
+                    """
+                    SELECT id, description, cv_data
+                    FROM cameras
+                    WHERE %(after_id)s IS NULL OR id > %(after_id)s
+                    ORDER BY id
+                    LIMIT %(limit)s;
+                    """,
+                    {"after_id": after_id, "limit": limit}
+                )
                 return cur.fetchall()
 
+    @staticmethod
+    def iter_all():
+        return iter_query("SELECT id, description, cv_data FROM cameras ORDER BY id;")
+
     @staticmethod
     def get_camera(camera_id: int):
         with get_db_connection() as conn:
@@ -1,3 +1,6 @@
+from psycopg2.extras import execute_values
+
+from async_database import get_async_connection
 from database import get_db_connection
 
 
@@ -11,16 +14,95 @@ class CvDAO:
                 return cur.fetchall()
 
     @staticmethod
-    def update_occupancy(id_parking: int, occupancy: int):
+    def update_occupancy(id_parking: int, occupancy: int, observed_at):
+        """
+        Одиночное наблюдение со временем приёма observed_at (часы сервера приложения).
+        Возвращает (статус 'updated' | 'stale' | 'not_found', bbox геометрии или None).
+        """
+        row = CvDAO.apply_observations([(id_parking, occupancy, observed_at, observed_at)])[0]
+        return row[1], (tuple(row[2:]) if row[1] == "updated" else None)
+
+    @staticmethod
+    def update_occupancy_batch(updates: list):
+        """
+        Применяет пачку (id_parking, occupancy, время приёма) одним UPDATE. Как и в
+        apply_observations, значение пишется, только если принято позже сохранённого.
+        Строки, где значение не изменилось, не трогаются, но в историю попадают все
+        наблюдения. Возвращает (id, bbox...) реально обновлённых парковок.
+        """
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute(
-                    "UPDATE parkings SET occupancy = %s WHERE id = %s",
-                    (occupancy, id_parking)
+                return execute_values(
+                    cur,
+                    """
+                    WITH v(id, occupancy, observed_at) AS (VALUES %s),
+                    history AS (
+                        INSERT INTO occupancy_samples (id_parking, observed_at, occupancy)
+                        SELECT v.id, v.observed_at, v.occupancy FROM v JOIN parkings p ON p.id = v.id
+                    )
+                    UPDATE parkings p SET occupancy = v.occupancy, occupancy_observed_at = v.observed_at
+                    FROM v
+                    WHERE p.id = v.id AND p.occupancy IS DISTINCT FROM v.occupancy
+                      AND (p.occupancy_observed_at IS NULL OR p.occupancy_observed_at < v.observed_at)
+                    RETURNING p.id,
+                              ST_XMin(p.coordinates), ST_YMin(p.coordinates),
+                              ST_XMax(p.coordinates), ST_YMax(p.coordinates)
+                    """,
+                    updates,
+                    template="(%s::integer, %s::integer, %s::timestamptz)",
+                    page_size=len(updates),
+                    fetch=True,
+                )
+
+    @staticmethod
+    def apply_observations(observations: list):
+        """
+        Применяет пачку (id_parking, occupancy, observed_at, received_at) одним запросом.
+
+        occupancy_observed_at хранит время приёма наблюдения сервером — у всех путей
+        записи (одиночный PATCH, write-behind, пакетный приём) одни часы. Наблюдение
+        записывается в parkings, только если принято позже сохранённого; в историю
+        попадают все наблюдения существующих парковок со временем камеры observed_at.
+
+        Возвращает по строке на каждое наблюдение: id, статус ('updated', 'stale',
+        'not_found') и bbox геометрии для обновлённых парковок.
+        """
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                return execute_values(
+                    cur,
+                    """
+                    WITH v(id, occupancy, observed_at, received_at) AS (VALUES %s),
+                    upd AS (
+                        UPDATE parkings p
+                        SET occupancy = v.occupancy, occupancy_observed_at = v.received_at
+                        FROM v
+                        WHERE p.id = v.id
+                          AND (p.occupancy_observed_at IS NULL OR p.occupancy_observed_at < v.received_at)
+                        RETURNING p.id,
+                                  ST_XMin(p.coordinates) AS xmin, ST_YMin(p.coordinates) AS ymin,
+                                  ST_XMax(p.coordinates) AS xmax, ST_YMax(p.coordinates) AS ymax
+                    ),
+                    history AS (
+                        INSERT INTO occupancy_samples (id_parking, observed_at, occupancy)
+                        SELECT v.id, v.observed_at, v.occupancy FROM v JOIN parkings p ON p.id = v.id
+                    )
+                    SELECT v.id,
+                           CASE
+                               WHEN upd.id IS NOT NULL THEN 'updated'
+                               WHEN p.id IS NOT NULL THEN 'stale'
+                               ELSE 'not_found'
+                           END,
+                           upd.xmin, upd.ymin, upd.xmax, upd.ymax
+                    FROM v
+                    LEFT JOIN upd ON upd.id = v.id
+                    LEFT JOIN parkings p ON p.id = v.id
+                    """,
+                    observations,
+                    template="(%s::integer, %s::integer, %s::timestamptz, %s::timestamptz)",
+                    page_size=len(observations),
+                    fetch=True,
                 )
-                row_count = cur.rowcount
-                conn.commit()
-                return row_count
 
     @staticmethod
     def get_status(id_parking: int):
@@ -31,3 +113,19 @@ class CvDAO:
                     (id_parking,)
                 )
                 return cur.fetchone()
+
+    @staticmethod
+    async def get_status_async(id_parking: int):
+        async with get_async_connection() as conn:
+            return await conn.fetchrow(
+                "SELECT occupancy FROM parkings WHERE id = $1",
+                id_parking
+            )
+
+    @staticmethod
+    async def get_statuses_async(ids: list):
+        async with get_async_connection() as conn:
+            return await conn.fetch(
+                "SELECT id, occupancy FROM parkings WHERE id = ANY($1::integer[])",
+                ids
+            )
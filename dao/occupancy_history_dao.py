@@ -0,0 +1,197 @@
+from datetime import date, datetime, timedelta, timezone
+
+from async_database import get_async_connection
+from database import get_db_connection, iter_query
+
+
+# Агрегат -> (шаг date_trunc, источник). 1m собирается из сырых наблюдений, крупные — из более мелких
+ROLLUP_STEPS = (
+    ("1m", "minute", None),
+    ("1h", "hour", "1m"),
+    ("1d", "day", "1h"),
+)
+# Ключ pg_try_advisory_xact_lock: пересчёт агрегатов выполняет один процесс за раз
+ROLLUP_LOCK_KEY = 5017
+SAMPLES_PARTITION_PREFIX = "occupancy_samples_"
+
+
+class OccupancyHistoryDAO:
+
+    @staticmethod
+    def create_partition(day: date) -> bool:
+        """
+        Создаёт дневную секцию occupancy_samples за day (границы — полночь UTC) в
+        отдельной транзакции. Наблюдения её диапазона, уже попавшие в default-секцию,
+        переносятся в новую секцию до ATTACH, иначе он не проходит. Возвращает False,
+        если секция уже есть.
+        """
+        name = f"{SAMPLES_PARTITION_PREFIX}{day:%Y%m%d}"
+        lower = f"{day.isoformat()} 00:00+00"
+        upper = f"{(day + timedelta(days=1)).isoformat()} 00:00+00"
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT to_regclass(%s) IS NOT NULL", (name,))
+                if cur.fetchone()[0]:
+                    return False
+                # Вставки в default-секцию ждут до конца транзакции: между переносом
+                # строк и ATTACH в диапазон новой секции ничего не добавится
+                cur.execute("LOCK TABLE occupancy_samples_default IN ACCESS EXCLUSIVE MODE")
+                cur.execute(f"CREATE TABLE IF NOT EXISTS {name} (LIKE occupancy_samples INCLUDING DEFAULTS)")
+                cur.execute(f"""
+                    WITH moved AS (
+                        DELETE FROM occupancy_samples_default
+                        WHERE observed_at >= %(lower)s AND observed_at < %(upper)s
+                        RETURNING id_parking, observed_at, occupancy
+                    )
+                    INSERT INTO {name} (id_parking, observed_at, occupancy)
+                    SELECT id_parking, observed_at, occupancy FROM moved
+                """, {"lower": lower, "upper": upper})
+                cur.execute(f"""
+                    ALTER TABLE occupancy_samples ATTACH PARTITION {name}
+                    FOR VALUES FROM ('{lower}') TO ('{upper}')
+                """)
+        return True
+
+    @staticmethod
+    def drop_partitions(keep_days: int) -> int:
+        """Удаляет дневные секции старше keep_days и чистит default-секцию. Возвращает число удалённых секций."""
+        cutoff = datetime.now(timezone.utc).date() - timedelta(days=keep_days)
+        dropped = 0
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT c.relname
+                    FROM pg_inherits i
+                    JOIN pg_class c ON c.oid = i.inhrelid
+                    WHERE i.inhparent = 'occupancy_samples'::regclass
+                """)
+                for (name,) in cur.fetchall():
+                    suffix = name[len(SAMPLES_PARTITION_PREFIX):]
+                    if not suffix.isdigit():
+                        continue
+                    if datetime.strptime(suffix, "%Y%m%d").date() < cutoff:
+                        cur.execute(f"DROP TABLE IF EXISTS {name}")
+                        dropped += 1
+                cur.execute(
+                    "DELETE FROM occupancy_samples_default WHERE observed_at < %s OR observed_at > now() + interval '1 day'",
+                    (datetime.combine(cutoff, datetime.min.time(), timezone.utc),)
+                )
+        return dropped
+
+    @staticmethod
+    def rollup(late_window_seconds: int) -> bool:
+        """
+        Пересчитывает агрегаты 1m/1h/1d за последние late_window_seconds, чтобы учесть
+        запоздавшие наблюдения. Пересчёт идемпотентен (upsert по бакету). Возвращает
+        False, если его прямо сейчас выполняет другой процесс.
+        """
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (ROLLUP_LOCK_KEY,))
+                if not cur.fetchone()[0]:
+                    return False
+                for resolution, unit, source in ROLLUP_STEPS:
+                    if source is None:
+                        select = f"""
+                            SELECT id_parking, date_trunc('{unit}', observed_at) AS bucket,
+                                   count(*), min(occupancy), sum(occupancy), max(occupancy)
+                            FROM occupancy_samples
+                            WHERE observed_at >= date_trunc('{unit}', now() - %(window)s * interval '1 second')
+                            GROUP BY 1, 2
+                        """
+                    else:
+                        select = f"""
+                            SELECT id_parking, date_trunc('{unit}', bucket) AS bucket,
+                                   sum(samples), min(occ_min), sum(occ_sum), max(occ_max)
+                            FROM occupancy_rollups
+                            WHERE resolution = '{source}'
+                              AND bucket >= date_trunc('{unit}', now() - %(window)s * interval '1 second')
+                            GROUP BY 1, 2
+                        """
+                    cur.execute(f"""
+                        INSERT INTO occupancy_rollups
+                            (resolution, id_parking, bucket, samples, occ_min, occ_sum, occ_max)
+                        SELECT '{resolution}', agg.* FROM ({select}) AS agg
+                        ON CONFLICT (resolution, id_parking, bucket) DO UPDATE SET
+                            samples = EXCLUDED.samples,
+                            occ_min = EXCLUDED.occ_min,
+                            occ_sum = EXCLUDED.occ_sum,
+                            occ_max = EXCLUDED.occ_max
+                    """, {"window": late_window_seconds})
+        return True
+
+    @staticmethod
+    def prune_rollups(retention_seconds: dict):
+        """Удаляет агрегаты старше срока хранения своего разрешения ({'1m': секунды, ...})."""
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                for resolution, seconds in retention_seconds.items():
+                    cur.execute(
+                        "DELETE FROM occupancy_rollups WHERE resolution = %s AND bucket < now() - %s * interval '1 second'",
+                        (resolution, seconds)
+                    )
+
+    @staticmethod
+    def count_hourly_averages(since_epoch: int) -> int:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT count(*) FROM occupancy_rollups WHERE resolution = '1h' AND bucket >= to_timestamp(%s)",
+                    (since_epoch,)
+                )
+                return cur.fetchone()[0]
+
+    @staticmethod
+    def iter_hourly_averages(since_epoch: int):
+        """Часовые средние всех парковок с since_epoch: (id_parking, начало часа в epoch, среднее)."""
+        return iter_query(
+            """
+            SELECT id_parking, extract(epoch FROM bucket)::bigint, occ_sum::float8 / samples
+            FROM occupancy_rollups
+            WHERE resolution = '1h' AND bucket >= to_timestamp(%s)
+            """,
+            (since_epoch,)
+        )
+
+    @staticmethod
+    def get_capacities():
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT id, all_spaces FROM parkings")
+                return cur.fetchall()
+
+    @staticmethod
+    async def get_parking_history_async(id_parking: int, resolution: str, start: datetime, end: datetime):
+        async with get_async_connection() as conn:
+            return await conn.fetch(
+                """
+                SELECT bucket, samples, occ_min, occ_sum::float8 / samples, occ_max
+                FROM occupancy_rollups
+                WHERE resolution = $1 AND id_parking = $2 AND bucket >= $3 AND bucket < $4
+                ORDER BY bucket
+                """,
+                resolution, id_parking, start, end
+            )
+
+    @staticmethod
+    async def get_district_history_async(district: str, resolution: str, start: datetime, end: datetime):
+        """
+        Суммарная занятость района по бакетам: сумма средних по парковкам и суммы
+        их минимумов/максимумов (нижняя и верхняя граница суммарной занятости).
+        """
+        async with get_async_connection() as conn:
+            return await conn.fetch(
+                """
+                SELECT r.bucket,
+                       count(*),
+                       sum(r.occ_min),
+                       sum(r.occ_sum::float8 / r.samples),
+                       sum(r.occ_max)
+                FROM occupancy_rollups r
+                JOIN parkings p ON p.id = r.id_parking
+                WHERE r.resolution = $1 AND p.district = $2 AND r.bucket >= $3 AND r.bucket < $4
+                GROUP BY r.bucket
+                ORDER BY r.bucket
+                """,
+                resolution, district, start, end
+            )
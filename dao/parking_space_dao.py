@@ -1,13 +1,15 @@
+from typing import Optional
+
 import psycopg2
 from fastapi import HTTPException
 
-from database import get_db_connection
+from database import get_db_connection, iter_query
 
 
 class ParkingSpaceDAO:
 
     @staticmethod
-    def get_all():
+    def get_all(after_id: Optional[str] = None, limit: int = 100):
         with get_db_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("""
@@ -17,13 +19,28 @@ class ParkingSpaceDAO:
                         ST_Y(coordinates) AS lat,
                         id_parking
                     FROM parking_spaces
-                """)
+                    WHERE %(after_id)s::uuid IS NULL OR id > %(after_id)s::uuid
+                    ORDER BY id
+                    LIMIT %(limit)s
+                """, {"after_id": after_id, "limit": limit})
                 rows = cur.fetchall()
                 return [
                     {"id": str(r[0]), "coordinates": {"lon": r[1], "lat": r[2]}, "id_parking": r[3]}
                     for r in rows
                 ]
 
+    @staticmethod
+    def iter_all():
+        return iter_query("""
+            SELECT
+                id,
+                ST_X(coordinates) AS lon,
+                ST_Y(coordinates) AS lat,
+                id_parking
+            FROM parking_spaces
+            ORDER BY id
+        """)
+
     @staticmethod
     def get_by_id(space_id: str):
         with get_db_connection() as conn:
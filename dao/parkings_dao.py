@@ -3,13 +3,55 @@ from typing import Optional
 
 from fastapi import HTTPException
 
-from database import get_db_connection
+from async_database import get_async_connection
+from database import get_db_connection, iter_query
+from geo import PARKING_LODS, parking_lod
+
+
+# Во сколько раз больше кандидатов KNN по планарному расстоянию отбирается для
+# пересортировки по расстоянию на сфере (см. get_nearest_async)
+NEAREST_CANDIDATE_FACTOR = 4
+
+
+# Границы геометрии в конце RETURNING/SELECT — по ним сбрасываются ячейки bbox_cache
+def _bbox_columns(geometry: str) -> str:
+    return f"ST_XMin({geometry}), ST_YMin({geometry}), ST_XMax({geometry}), ST_YMax({geometry})"
+
+
+def _item_json_columns() -> str:
+    """
+    Готовый JSON объекта парковки (как в ответе in_area) для каждого уровня детализации,
+    без occupancy: её снимок хранит отдельно и дописывает в конец объекта при чтении.
+    """
+    return ",\n".join(
+        f"""json_build_object(
+            'id', id,
+            'description', description,
+            'coordinates', ST_AsGeoJSON({column}, {digits})::json,
+            'name', name,
+            'name_obj', name_obj,
+            'adm_area', adm_area,
+            'district', district,
+            'all_spaces', all_spaces
+        )::text"""
+        for _, column, _, digits in PARKING_LODS
+    )
+
+
+def _refresh_lods(cur, parking_id: int):
+    """Пересчитывает упрощённые геометрии coordinates_lodN из полной геометрии парковки."""
+    assignments = ", ".join(
+        f"{column} = ST_SimplifyPreserveTopology(coordinates, {tolerance})"
+        for _, column, tolerance, _ in PARKING_LODS
+        if tolerance is not None
+    )
+    cur.execute(f"UPDATE parkings SET {assignments} WHERE id = %s", (parking_id,))
 
 
 class ParkingsDAO:
 
     @staticmethod
-    def get_all():
+    def get_all(after_id: Optional[int] = None, limit: int = 100):
         with get_db_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("""
@@ -24,9 +66,104 @@ class ParkingsDAO:
                         occupancy,
                         all_spaces
                     FROM parkings
-                """)
+                    WHERE %(after_id)s IS NULL OR id > %(after_id)s
+                    ORDER BY id
+                    LIMIT %(limit)s
+                """, {"after_id": after_id, "limit": limit})
                 return cur.fetchall()
 
+    @staticmethod
+    def iter_all():
+        """Все парковки потоком через server-side курсор (для выгрузок и предзагрузки карты)."""
+        return iter_query("""
+            SELECT
+                id,
+                description,
+                ST_AsGeoJSON(coordinates, 6) AS coordinates,
+                name,
+                name_obj,
+                adm_area,
+                district,
+                occupancy,
+                all_spaces
+            FROM parkings
+            ORDER BY id
+        """)
+
+    @staticmethod
+    def iter_index_rows(ids: Optional[list] = None):
+        """
+        Строки для снимка парковок: id, bbox, occupancy и сериализованный объект под
+        каждый уровень детализации из geo.PARKING_LODS, по возрастанию id.
+        Без ids — вся таблица потоком. Парковки без геометрии в снимок не попадают.
+        """
+        query = f"""
+            SELECT
+                id,
+                {_bbox_columns("coordinates")},
+                occupancy,
+                {_item_json_columns()}
+            FROM parkings
+            WHERE coordinates IS NOT NULL {{where}}
+            ORDER BY id
+        """
+        if ids is None:
+            return iter_query(query.format(where=""))
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query.format(where="AND id = ANY(%s)"), (ids,))
+                return cur.fetchall()
+
+    @staticmethod
+    def get_occupancies(ids: list):
+        """(id, occupancy) парковок из ids — для обновления снимка на месте."""
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT id, occupancy FROM parkings WHERE id = ANY(%s)", (ids,))
+                return cur.fetchall()
+
+    @staticmethod
+    def get_changes_version() -> int:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT COALESCE(MAX(version), 0) FROM parkings_changes")
+                return cur.fetchone()[0]
+
+    @staticmethod
+    def get_changes(after_version: int, overlap_seconds: int):
+        """
+        Изменённые с after_version парковки: (максимальная версия, id изменённых
+        целиком, id с изменённой только occupancy). Id из первого списка во второй
+        не входят.
+
+        bigserial выдаётся при вставке, а коммиты могут прийти в другом порядке,
+        поэтому изменения за последние overlap_seconds перечитываются повторно.
+        """
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT version, id_parking, occupancy_only
+                    FROM parkings_changes
+                    WHERE version > %s
+                       OR changed_at > now() - make_interval(secs => %s)
+                """, (after_version, overlap_seconds))
+                rows = cur.fetchall()
+        if not rows:
+            return after_version, [], []
+        changed = {id_parking for _, id_parking, occupancy_only in rows if not occupancy_only}
+        occupancy = {id_parking for _, id_parking, occupancy_only in rows if occupancy_only} - changed
+        return max(after_version, max(version for version, _, _ in rows)), list(changed), list(occupancy)
+
+    @staticmethod
+    def prune_changes(retention_seconds: int):
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "DELETE FROM parkings_changes WHERE changed_at < now() - make_interval(secs => %s)",
+                    (retention_seconds,)
+                )
+                conn.commit()
+
     @staticmethod
     def get_in_area(lat_min: float, lat_max: float, lon_min: float, lon_max: float):
         """Поиск парковок в прямоугольной зоне через PostGIS ST_Within."""
@@ -48,6 +185,98 @@ class ParkingsDAO:
                 """, (lon_min, lat_min, lon_max, lat_max))
                 return cur.fetchall()
 
+    @staticmethod
+    async def get_in_area_async(lat_min: float, lat_max: float, lon_min: float, lon_max: float,
+                                zoom: Optional[int] = None, limit: Optional[int] = None):
+        """
+        Асинхронная версия get_in_area для обработчиков карты.
+        Геометрия берётся из колонки с детализацией под zoom (см. geo.PARKING_LODS),
+        последние четыре поля — bbox полной геометрии.
+        """
+        column, digits = parking_lod(zoom)
+        async with get_async_connection() as conn:
+            return await conn.fetch(f"""
+                SELECT
+                    id,
+                    description,
+                    ST_AsGeoJSON({column}, {digits}) AS coordinates,
+                    name,
+                    name_obj,
+                    adm_area,
+                    district,
+                    occupancy,
+                    all_spaces,
+                    {_bbox_columns("coordinates")}
+                FROM parkings
+                WHERE ST_Intersects(coordinates, ST_MakeEnvelope($1, $2, $3, $4, 4326))
+                ORDER BY id
+                LIMIT $5
+            """, lon_min, lat_min, lon_max, lat_max, limit)
+
+    @staticmethod
+    async def get_nearest_async(lat: float, lon: float, k: int, min_free: int, exact_free: bool = True):
+        """
+        k ближайших к точке парковок по расстоянию на сфере (distance_m, метры).
+
+        KNN-оператор <-> по GiST-индексу считает планарное расстояние в градусах, а
+        градус долготы короче градуса широты, поэтому индекс отбирает с запасом
+        k * NEAREST_CANDIDATE_FACTOR кандидатов, и они пересортировываются по distance_m.
+
+        При exact_free фильтр all_spaces - occupancy >= min_free применяется прямо
+        в индексном обходе; иначе фильтруется только по вместимости (all_spaces),
+        чтобы вызывающий мог пересчитать свободные места по живой занятости.
+        """
+        free_filter = (
+            "GREATEST(COALESCE(all_spaces, 0) - COALESCE(occupancy, 0), 0) >= $3"
+            if exact_free else
+            "COALESCE(all_spaces, 0) >= $3"
+        )
+        async with get_async_connection() as conn:
+            return await conn.fetch(f"""
+                SELECT * FROM (
+                    SELECT
+                        id,
+                        description,
+                        ST_AsGeoJSON(coordinates, 6) AS coordinates,
+                        name,
+                        name_obj,
+                        adm_area,
+                        district,
+                        occupancy,
+                        all_spaces,
+                        ST_Distance(coordinates::geography, ST_SetSRID(ST_MakePoint($1, $2), 4326)::geography) AS distance_m
+                    FROM parkings
+                    WHERE {free_filter}
+                    ORDER BY coordinates <-> ST_SetSRID(ST_MakePoint($1, $2), 4326)
+                    LIMIT $5
+                ) AS candidates
+                ORDER BY distance_m, id
+                LIMIT $4
+            """, lon, lat, min_free, k, k * NEAREST_CANDIDATE_FACTOR)
+
+    @staticmethod
+    async def get_clusters_async(lat_min: float, lat_max: float, lon_min: float, lon_max: float,
+                                 cell_size: float):
+        """Кластеры парковок по сетке ST_SnapToGrid для мелких зумов."""
+        async with get_async_connection() as conn:
+            return await conn.fetch("""
+                SELECT
+                    COUNT(*) AS count,
+                    COALESCE(SUM(all_spaces), 0)::bigint AS all_spaces,
+                    COALESCE(SUM(GREATEST(all_spaces - COALESCE(occupancy, 0), 0)), 0)::bigint AS free_spaces,
+                    AVG(ST_X(center)) AS lon,
+                    AVG(ST_Y(center)) AS lat
+                FROM (
+                    SELECT
+                        ST_Centroid(coordinates) AS center,
+                        all_spaces,
+                        occupancy
+                    FROM parkings
+                    WHERE coordinates && ST_MakeEnvelope($1, $2, $3, $4, 4326)
+                ) p
+                GROUP BY ST_SnapToGrid(center, $5)
+            """, lon_min, lat_min, lon_max, lat_max, cell_size)
+
     @staticmethod
     def get_by_id(parking_id: int):
         with get_db_connection() as conn:
@@ -68,6 +297,24 @@ class ParkingsDAO:
                 """, (parking_id,))
                 return cur.fetchone()
 
+    @staticmethod
+    async def get_by_id_async(parking_id: int):
+        async with get_async_connection() as conn:
+            return await conn.fetchrow("""
+                SELECT
+                    id,
+                    description,
+                    ST_AsGeoJSON(coordinates) AS coordinates,
+                    name,
+                    name_obj,
+                    adm_area,
+                    district,
+                    occupancy,
+                    all_spaces
+                FROM parkings
+                WHERE id = $1
+            """, parking_id)
+
     @staticmethod
     def get_fields(parking_id: int, selected_fields: str):
         with get_db_connection() as conn:
@@ -76,24 +323,68 @@ class ParkingsDAO:
                 return cur.fetchone()
 
     @staticmethod
-    def get_geojson(parking_id: int):
+    def get_geojson(parking_id: int, zoom: Optional[int] = None) -> Optional[str]:
+        """Готовый GeoJSON Feature парковки, собранный в PostGIS (ST_AsGeoJSON от записи)."""
+        column, digits = parking_lod(zoom)
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("""
+                cur.execute(f"""
+                    SELECT ST_AsGeoJSON(f.*, 'geom', {digits})
+                    FROM (
+                        SELECT
+                            id,
+                            name,
+                            description,
+                            name_obj,
+                            adm_area,
+                            district,
+                            occupancy,
+                            all_spaces,
+                            {column} AS geom
+                        FROM parkings
+                        WHERE id = %s
+                    ) f
+                """, (parking_id,))
+                row = cur.fetchone()
+                return row[0] if row is not None else None
+
+    @staticmethod
+    async def get_in_area_geojson_async(lat_min: float, lat_max: float, lon_min: float, lon_max: float,
+                                        zoom: Optional[int], limit: int) -> str:
+        """
+        FeatureCollection парковок в bbox целиком собирается в PostGIS и возвращается
+        текстом. Фичи склеиваются string_agg без промежуточного разбора в json,
+        лишняя строка (LIMIT limit + 1) выставляет "truncated".
+        """
+        column, digits = parking_lod(zoom)
+        async with get_async_connection() as conn:
+            return await conn.fetchval(f"""
+                WITH f AS (
                     SELECT
                         id,
-                        description,
-                        ST_AsGeoJSON(coordinates) AS coordinates,
                         name,
+                        description,
                         name_obj,
                         adm_area,
                         district,
                         occupancy,
-                        all_spaces
+                        all_spaces,
+                        {column} AS geom
                     FROM parkings
-                    WHERE id = %s
-                """, (parking_id,))
-                return cur.fetchone()
+                    WHERE ST_Intersects(coordinates, ST_MakeEnvelope($1, $2, $3, $4, 4326))
+                    ORDER BY id
+                    LIMIT $5 + 1
+                ),
+                n AS (
+                    SELECT f, row_number() OVER (ORDER BY f.id) AS rn FROM f
+                )
+                SELECT
+                    '{{"type":"FeatureCollection","features":['
+                    || COALESCE(string_agg(ST_AsGeoJSON(n.f, 'geom', {digits}), ',' ORDER BY n.rn)
+                                FILTER (WHERE n.rn <= $5), '')
+                    || '],"truncated":' || (COUNT(*) > $5)::text || '}}'
+                FROM n
+            """, lon_min, lat_min, lon_max, lat_max, limit)
 
     @staticmethod
     def create(
@@ -112,16 +403,21 @@ class ParkingsDAO:
         with get_db_connection() as conn:
             with conn.cursor() as cur:
                 query = """
-                    INSERT INTO parkings (description, coordinates, name, name_obj, adm_area, district, occupancy, all_spaces)
+                    INSERT INTO parkings
+                        (description, coordinates, name, name_obj, adm_area, district, occupancy, all_spaces)
                     VALUES (%s, ST_GeomFromGeoJSON(%s), %s, %s, %s, %s, %s, %s)
                     RETURNING
                         id,
                         name,
-                        ST_AsGeoJSON(coordinates) AS coordinates
-                """
+                        ST_AsGeoJSON(coordinates) AS coordinates,
+                        {bbox}
+                """.format(bbox=_bbox_columns("coordinates"))
                 try:
-                    cur.execute(query, (description, geojson_str, name, name_obj, adm_area, district, occupancy, all_spaces))
+                    cur.execute(query, (
+                        description, geojson_str, name, name_obj, adm_area, district, occupancy, all_spaces
+                    ))
                     created = cur.fetchone()
+                    _refresh_lods(cur, created[0])
                     conn.commit()
                     return created
                 except Exception as e:
@@ -130,21 +426,28 @@ class ParkingsDAO:
 
     @staticmethod
     def update(updates: list[str], params: list):
+        """Возвращает id, name, occupancy и bbox геометрии до и после обновления."""
         with get_db_connection() as conn:
             with conn.cursor() as cur:
                 query = f"""
-                    UPDATE parkings
+                    UPDATE parkings p
                     SET {", ".join(updates)}
-                    WHERE id = %s
-                    RETURNING id, name, occupancy
+                    FROM (SELECT id, coordinates FROM parkings WHERE id = %s) old
+                    WHERE p.id = old.id
+                    RETURNING p.id, p.name, p.occupancy,
+                        {_bbox_columns("old.coordinates")},
+                        {_bbox_columns("p.coordinates")}
                 """
                 cur.execute(query, params)
                 updated = cur.fetchone()
-                conn.commit()
 
                 if updated is None:
                     raise HTTPException(status_code=404, detail="Parking not found")
 
+                if any(update.startswith("coordinates ") for update in updates):
+                    _refresh_lods(cur, updated[0])
+                conn.commit()
+
                 return updated
 
     @staticmethod
@@ -154,8 +457,8 @@ class ParkingsDAO:
                 cur.execute("""
                     DELETE FROM parkings
                     WHERE id = %s
-                    RETURNING id
-                """, (parking_id,))
+                    RETURNING id, {bbox}
+                """.format(bbox=_bbox_columns("coordinates")), (parking_id,))
                 deleted = cur.fetchone()
                 conn.commit()
 
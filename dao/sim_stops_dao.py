@@ -1,10 +1,11 @@
 from typing import List, Tuple, Optional
-from database import get_db_connection
+from async_database import get_async_connection
+from database import get_db_connection, iter_query
 from schemas.simStopsModels import SIMStopUpdate
 
 class SimStopsDAO:
     @staticmethod
-    def get_all() -> List[Tuple]:
+    def get_all(after_id: Optional[int] = None, limit: int = 100) -> List[Tuple]:
         with get_db_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("""
@@ -17,10 +18,27 @@ class SimStopsDAO:
                         district,
                         free_sims
                     FROM sim_stops
+                    WHERE %(after_id)s IS NULL OR id > %(after_id)s
                     ORDER BY id
-                """)
+                    LIMIT %(limit)s
+                """, {"after_id": after_id, "limit": limit})
                 return cur.fetchall()
 
+    @staticmethod
+    def iter_all():
+        return iter_query("""
+            SELECT
+                id,
+                description,
+                ST_X(coordinates) AS lon,
+                ST_Y(coordinates) AS lat,
+                adm_area,
+                district,
+                free_sims
+            FROM sim_stops
+            ORDER BY id
+        """)
+
     @staticmethod
     def get_by_id(stop_id: int) -> Optional[Tuple]:
         with get_db_connection() as conn:
@@ -65,6 +83,45 @@ class SimStopsDAO:
                       lon_min, lat_min, lon_max, lat_max))
                 return cur.fetchall()
 
+    @staticmethod
+    async def get_in_area_async(lat_min: float, lat_max: float,
+                                lon_min: float, lon_max: float,
+                                limit: Optional[int] = None) -> List[Tuple]:
+        """Асинхронная версия get_in_area."""
+        async with get_async_connection() as conn:
+            return await conn.fetch("""
+                SELECT
+                    id,
+                    description,
+                    ST_X(coordinates) AS lon,
+                    ST_Y(coordinates) AS lat,
+                    adm_area,
+                    district,
+                    free_sims
+                FROM sim_stops
+                WHERE coordinates && ST_MakeEnvelope($1, $2, $3, $4, 4326)
+                  AND ST_Within(coordinates, ST_MakeEnvelope($1, $2, $3, $4, 4326))
+                ORDER BY id
+                LIMIT $5
+            """, lon_min, lat_min, lon_max, lat_max, limit)
+
+    @staticmethod
+    async def get_clusters_async(lat_min: float, lat_max: float,
+                                 lon_min: float, lon_max: float,
+                                 cell_size: float) -> List[Tuple]:
+        """Кластеры остановок СИМ по сетке ST_SnapToGrid для мелких зумов."""
+        async with get_async_connection() as conn:
+            return await conn.fetch("""
+                SELECT
+                    COUNT(*) AS count,
+                    COALESCE(SUM(free_sims), 0)::bigint AS free_sims,
+                    AVG(ST_X(coordinates)) AS lon,
+                    AVG(ST_Y(coordinates)) AS lat
+                FROM sim_stops
+                WHERE coordinates && ST_MakeEnvelope($1, $2, $3, $4, 4326)
+                GROUP BY ST_SnapToGrid(coordinates, $5)
+            """, lon_min, lat_min, lon_max, lat_max, cell_size)
+
     @staticmethod
     def create(
         description: Optional[str],
@@ -0,0 +1,60 @@
+from async_database import get_async_connection
+
+
+# Для каждого слоя — таблица и минимальный набор атрибутов, который нужен клиенту для отрисовки
+_LAYER_QUERIES = {
+    "parkings": """
+        WITH bounds AS (
+            SELECT ST_TileEnvelope($1, $2, $3) AS geom
+        ),
+        mvtgeom AS (
+            SELECT
+                ST_AsMVTGeom(ST_Transform(p.coordinates, 3857), bounds.geom) AS geom,
+                p.id,
+                p.occupancy,
+                p.all_spaces
+            FROM parkings p, bounds
+            WHERE p.coordinates && ST_Transform(bounds.geom, 4326)
+        )
+        SELECT ST_AsMVT(mvtgeom.*, 'parkings') FROM mvtgeom
+    """,
+    "sim_stops": """
+        WITH bounds AS (
+            SELECT ST_TileEnvelope($1, $2, $3) AS geom
+        ),
+        mvtgeom AS (
+            SELECT
+                ST_AsMVTGeom(ST_Transform(s.coordinates, 3857), bounds.geom) AS geom,
+                s.id,
+                s.free_sims
+            FROM sim_stops s, bounds
+            WHERE s.coordinates && ST_Transform(bounds.geom, 4326)
+        )
+        SELECT ST_AsMVT(mvtgeom.*, 'sim_stops') FROM mvtgeom
+    """,
+    "bus_stops": """
+        WITH bounds AS (
+            SELECT ST_TileEnvelope($1, $2, $3) AS geom
+        ),
+        mvtgeom AS (
+            SELECT
+                ST_AsMVTGeom(ST_Transform(b.coordinates, 3857), bounds.geom) AS geom,
+                b.id
+            FROM bus_stops b, bounds
+            WHERE b.coordinates && ST_Transform(bounds.geom, 4326)
+        )
+        SELECT ST_AsMVT(mvtgeom.*, 'bus_stops') FROM mvtgeom
+    """,
+}
+
+TILE_LAYERS = frozenset(_LAYER_QUERIES)
+
+
+class TilesDAO:
+
+    @staticmethod
+    async def get_tile(layer: str, z: int, x: int, y: int) -> bytes:
+        """Собирает векторный тайл слоя средствами PostGIS (ST_AsMVT)."""
+        async with get_async_connection() as conn:
+            tile = await conn.fetchval(_LAYER_QUERIES[layer], z, x, y)
+            return bytes(tile) if tile is not None else b""
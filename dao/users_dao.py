@@ -1,20 +1,35 @@
+import csv
+import io
 from typing import Optional
 
 from fastapi import HTTPException
 from psycopg2 import sql
 
-from database import get_db_connection
+from database import get_db_connection, iter_query
 
 
 class UsersDAO:
 
     @staticmethod
-    def get_all():
+    def get_all(after_id: Optional[int] = None, limit: int = 100):
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("SELECT id, email, phone_number, subscription_status FROM users;")
+                cur.execute(
+                    """
+                    SELECT id, email, phone_number, subscription_status
+                    FROM users
+                    WHERE %(after_id)s IS NULL OR id > %(after_id)s
+                    ORDER BY id
+                    LIMIT %(limit)s;
+                    """,
+                    {"after_id": after_id, "limit": limit}
+                )
                 return cur.fetchall()
 
+    @staticmethod
+    def iter_all():
+        return iter_query("SELECT id, email, phone_number, subscription_status FROM users ORDER BY id;")
+
     @staticmethod
     def get(user_id: int):
         with get_db_connection() as conn:
@@ -110,15 +125,70 @@ class UsersDAO:
                 conn.commit()
                 return deleted
 
+    @staticmethod
+    def find_existing_emails(emails: list) -> set:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT email FROM users WHERE email = ANY(%s)", (emails,))
+                return {row[0] for row in cur.fetchall()}
+
+    @staticmethod
+    def import_users(rows: list) -> set:
+        """
+        Массовая вставка (email, phone_number, password_hash, subscription_status):
+        COPY во временную таблицу и один INSERT ... SELECT в users. Email, занятые
+        параллельно с импортом, пропускаются. Возвращает множество вставленных email.
+        """
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    CREATE TEMP TABLE users_import (
+                        email text,
+                        phone_number text,
+                        password_hash text,
+                        subscription_status boolean
+                    ) ON COMMIT DROP
+                """)
+                cur.copy_expert("COPY users_import FROM STDIN WITH (FORMAT csv)", buffer)
+                cur.execute("""
+                    INSERT INTO users (email, phone_number, password_hash, subscription_status)
+                    SELECT email, phone_number, password_hash, subscription_status FROM users_import
+                    ON CONFLICT (email) DO NOTHING
+                    RETURNING email
+                """)
+                return {row[0] for row in cur.fetchall()}
+
     @staticmethod
     def get_stats():
+        """Счётчики из users_stats (см. migrations/006_users_stats.sql) — одна строка вместо скана users."""
         with get_db_connection() as conn:
             with conn.cursor() as cur:
+                cur.execute("SELECT total, subscribers FROM users_stats")
+                return cur.fetchone() or (0, 0)
+
+    @staticmethod
+    def reconcile_stats():
+        """
+        Пересчитывает users_stats по таблице users. Возвращает (было, стало).
+
+        Строку счётчиков блокируем до подсчёта: транзакции, уже изменившие её, к
+        этому моменту закоммичены и попадут в снимок следующего запроса, а новые
+        будут ждать блокировку и применят свою дельту поверх пересчитанного значения.
+        """
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT total, subscribers FROM users_stats FOR UPDATE")
+                before = cur.fetchone()
                 cur.execute(
                     """
-                    SELECT COUNT(*) AS total,
-                           SUM(CASE WHEN subscription_status THEN 1 ELSE 0 END) AS subscribers
-                    FROM users;
+                    UPDATE users_stats s
+                    SET total = c.total, subscribers = c.subscribers
+                    FROM (SELECT count(*) AS total, count(*) FILTER (WHERE subscription_status) AS subscribers
+                          FROM users) c
+                    RETURNING s.total, s.subscribers
                     """
                 )
-                return cur.fetchone()
+                return before, cur.fetchone()
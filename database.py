@@ -1,22 +1,281 @@
 import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional
+from urllib.parse import quote
+
 import psycopg2
+from psycopg2 import extensions
+from prometheus_client import Gauge, Histogram
+
+from config import get_settings
+
+
+DB_POOL_IN_USE = Gauge("db_pool_in_use", "Соединения, выданные из пула")
+DB_POOL_IDLE = Gauge("db_pool_idle", "Свободные соединения в пуле")
+DB_POOL_WAITING = Gauge("db_pool_waiting", "Потоки, ожидающие соединение")
+DB_POOL_ACQUIRE_SECONDS = Histogram(
+    "db_pool_acquire_seconds",
+    "Время ожидания соединения из пула",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+
+# Сколько строк за раз тянет server-side курсор при потоковом чтении
+STREAM_ITERSIZE = 2000
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """Не удалось получить соединение из пула за отведённое время."""
+
+
+def get_database_url() -> str:
+    """Возвращает DSN базы данных из DATABASE_URL или отдельных переменных."""
 
-def get_db_connection():
-    """Создает подключение к базе данных используя DATABASE_URL или отдельные переменные."""
-    
     # Если есть DATABASE_URL (Render автоматически предоставляет её)
     database_url = os.getenv("DATABASE_URL")
     if database_url:
         if database_url.startswith("postgres://"):
             database_url = database_url.replace("postgres://", "postgresql://", 1)
-        
-        return psycopg2.connect(database_url)
-    
+        return database_url
+
     # Если DATABASE_URL нет, используем отдельные переменные (для локальной разработки)
-    return psycopg2.connect(
-        dbname=os.getenv("DB_NAME", "parkings_db"),
-        user=os.getenv("DB_USER", "parkings_db_user"),
-        password=os.getenv("DB_PASSWORD", "dxUVHnV0sqULLO73J2dxZETqne4feSK9"),
+    return "postgresql://{user}:{password}@{host}:{port}/{dbname}".format(
+        user=quote(os.getenv("DB_USER", "parkings_db_user"), safe=""),
+        password=quote(os.getenv("DB_PASSWORD", "dxUVHnV0sqULLO73J2dxZETqne4feSK9"), safe=""),
         host=os.getenv("DB_HOST", "localhost"),
-        port=os.getenv("DB_PORT", "5432")
-    )
\ No newline at end of file
+        port=os.getenv("DB_PORT", "5432"),
+        dbname=quote(os.getenv("DB_NAME", "parkings_db"), safe=""),
+    )
+
+
+def _connect():
+    """Создает подключение к базе данных."""
+    return psycopg2.connect(get_database_url())
+
+
+class _PooledConnection:
+    __slots__ = ("conn", "created_at", "last_used_at")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+
+
+class ConnectionPool:
+    """
+    Потокобезопасный пул соединений psycopg2.
+
+    Держит от min_size до max_size соединений. При выдаче проверяет, что соединение
+    живое (и делает SELECT 1, если оно долго простаивало), и пересоздаёт соединения
+    старше max_lifetime, чтобы не копить серверную память и переживать failover.
+    """
+
+    def __init__(self, min_size: int, max_size: int, acquire_timeout: float,
+                 max_lifetime: float, health_check_idle: float):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_idle = health_check_idle
+
+        self._idle = deque()
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+
+        for _ in range(min_size):
+            try:
+                self._idle.append(_PooledConnection(_connect()))
+                self._size += 1
+            except psycopg2.Error:
+                # База может быть недоступна при старте — добьём пул лениво
+                break
+
+        DB_POOL_IN_USE.set_function(lambda: self._in_use)
+        DB_POOL_IDLE.set_function(lambda: len(self._idle))
+        DB_POOL_WAITING.set_function(lambda: self._waiting)
+
+    def _is_usable(self, item: _PooledConnection) -> bool:
+        conn = item.conn
+        if conn.closed:
+            return False
+        if time.monotonic() - item.created_at > self.max_lifetime:
+            return False
+        if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if time.monotonic() - item.last_used_at > self.health_check_idle:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def _discard(self, item: _PooledConnection):
+        try:
+            item.conn.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def getconn(self):
+        started = time.monotonic()
+        deadline = started + self.acquire_timeout
+        while True:
+            item = None
+            create = False
+            with self._cond:
+                self._waiting += 1
+                try:
+                    while not self._idle and self._size >= self.max_size:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise PoolTimeout("Timed out waiting for a database connection")
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+                if self._idle:
+                    item = self._idle.pop()
+                else:
+                    self._size += 1
+                    create = True
+                self._in_use += 1
+
+            if create:
+                try:
+                    item = _PooledConnection(_connect())
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._in_use -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_usable(item):
+                with self._cond:
+                    self._in_use -= 1
+                self._discard(item)
+                continue
+
+            DB_POOL_ACQUIRE_SECONDS.observe(time.monotonic() - started)
+            return item
+
+    def putconn(self, item: _PooledConnection):
+        conn = item.conn
+        with self._cond:
+            self._in_use -= 1
+
+        if not conn.closed and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+
+        if conn.closed or time.monotonic() - item.created_at > self.max_lifetime:
+            self._discard(item)
+            return
+
+        item.last_used_at = time.monotonic()
+        with self._cond:
+            self._idle.append(item)
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            while self._idle:
+                item = self._idle.pop()
+                try:
+                    item.conn.close()
+                except psycopg2.Error:
+                    pass
+                self._size -= 1
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "size": self._size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+            }
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                settings = get_settings()
+                _pool = ConnectionPool(
+                    min_size=settings.db_pool_min_size,
+                    max_size=settings.db_pool_max_size,
+                    acquire_timeout=settings.db_pool_acquire_timeout,
+                    max_lifetime=settings.db_pool_max_lifetime,
+                    health_check_idle=settings.db_pool_health_check_idle,
+                )
+    return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+@contextmanager
+def get_db_connection():
+    """
+    Выдает соединение из общего пула процесса.
+
+    Поведение совпадает с `with psycopg2.connect(...) as conn`: при успешном выходе
+    транзакция коммитится, при исключении — откатывается, но само соединение
+    не закрывается, а возвращается в пул.
+    """
+    pool = get_pool()
+    item = pool.getconn()
+    conn = item.conn
+    try:
+        yield conn
+        if not conn.closed:
+            conn.commit()
+    except BaseException:
+        if not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+        raise
+    finally:
+        pool.putconn(item)
+
+
+def iter_query(query, params=None, itersize: int = STREAM_ITERSIZE):
+    """
+    Потоково читает результат запроса через именованный (server-side) курсор:
+    в памяти процесса одновременно не больше itersize строк. Соединение занято,
+    пока генератор не исчерпан или не закрыт (close()).
+    """
+    with get_db_connection() as conn:
+        # Уникальное имя: курсоры параллельных потоков не пересекаются и за пулером соединений
+        with conn.cursor(name=f"stream_{uuid.uuid4().hex}") as cur:
+            cur.itersize = itersize
+            cur.execute(query, params)
+            for row in cur:
+                yield row
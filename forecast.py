@@ -0,0 +1,189 @@
+"""
+Прогноз занятости парковок.
+
+Модель — сезонный профиль по часу недели плюс текущее отклонение от него,
+затухающее с горизонтом:
+
+    прогноз(t + h) = профиль[час_недели(t + h)] + отклонение * exp(-h / TREND_DECAY_HOURS)
+
+Профиль — среднее часовых агрегатов (occupancy_rollups, 1h) за HISTORY_WEEKS недель,
+отклонение — среднее (факт - профиль) за последние RECENT_HOURS часов. Всё
+считается матрицами NumPy сразу по всем парковкам. Готовые прогнозы на
+FORECAST_HORIZON_HOURS часов вперёд кладутся в Redis, и эндпоинты только читают их.
+
+Переобучение раз в RETRAIN_INTERVAL выполняет один процесс на кластер (lock в Redis):
+отдельный процесс `python forecast.py`. Фоновый поток в воркерах API включается
+только FORECAST_IN_APP=true (по умолчанию выключен): обучение держит CPU и память
+воркера, пока идёт.
+"""
+import json
+import logging
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+from prometheus_client import Gauge, Histogram
+
+from dao.occupancy_history_dao import OccupancyHistoryDAO
+from redis_client import redis_client as redis
+
+logger = logging.getLogger(__name__)
+
+HOURS_PER_WEEK = 168
+# Эпоха (1970-01-01) — четверг; сдвиг, чтобы час недели 0 был понедельником 00:00 UTC
+EPOCH_HOUR_OF_WEEK = 72
+HISTORY_WEEKS = 8
+RECENT_HOURS = 3
+TREND_DECAY_HOURS = 3.0
+FORECAST_HORIZON_HOURS = HOURS_PER_WEEK
+RETRAIN_INTERVAL = 3600
+CHECK_INTERVAL = 60.0
+FORECAST_LOCK_KEY = "parkings:forecast:lock"
+
+FORECAST_TRAIN_SECONDS = Histogram(
+    "forecast_train_seconds",
+    "Время обучения и публикации прогнозов",
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+FORECAST_PARKINGS = Gauge("forecast_parkings", "Парковок в последнем обучении прогноза")
+
+
+def forecast_key(id_parking: int) -> str:
+    return f"parking:{id_parking}:forecast"
+
+
+def fit(ids: np.ndarray, hours: np.ndarray, values: np.ndarray, now_hour: int) -> tuple:
+    """
+    Обучает модель и строит прогноз.
+
+    ids, hours, values — часовые средние (id парковки, номер часа от эпохи, занятость).
+    now_hour — текущий час от эпохи (ещё не завершённый). Возвращает (уникальные id,
+    матрица прогнозов [парковка, час] начиная с now_hour).
+    """
+    parking_ids, rows = np.unique(ids, return_inverse=True)
+
+    # Первая колонка матрицы — понедельник 00:00, поэтому колонка % 168 == час недели
+    first_hour = now_hour - HISTORY_WEEKS * HOURS_PER_WEEK
+    first_hour -= (first_hour + EPOCH_HOUR_OF_WEEK) % HOURS_PER_WEEK
+    weeks = (now_hour - first_hour) // HOURS_PER_WEEK + 1
+
+    cols = hours - first_hour
+    keep = (cols >= 0) & (cols < now_hour - first_hour)
+    history = np.full((len(parking_ids), weeks * HOURS_PER_WEEK), np.nan)
+    history[rows[keep], cols[keep]] = values[keep]
+
+    by_week = history.reshape(len(parking_ids), weeks, HOURS_PER_WEEK)
+    counts = np.sum(~np.isnan(by_week), axis=1)
+    profile = np.nansum(by_week, axis=1) / np.maximum(counts, 1)
+    # Часы без данных — средняя занятость парковки
+    overall = np.nansum(history, axis=1) / np.maximum(np.sum(~np.isnan(history), axis=1), 1)
+    profile = np.where(counts > 0, profile, overall[:, None])
+
+    recent_cols = np.arange(now_hour - RECENT_HOURS, now_hour) - first_hour
+    recent_how = recent_cols % HOURS_PER_WEEK
+    deviation = history[:, recent_cols] - profile[:, recent_how]
+    recent_counts = np.sum(~np.isnan(deviation), axis=1)
+    trend = np.nansum(deviation, axis=1) / np.maximum(recent_counts, 1)
+
+    horizon = np.arange(FORECAST_HORIZON_HOURS)
+    how = (now_hour - first_hour + horizon) % HOURS_PER_WEEK
+    predictions = profile[:, how] + trend[:, None] * np.exp(-horizon / TREND_DECAY_HOURS)[None, :]
+    return parking_ids, np.maximum(predictions, 0.0)
+
+
+def train():
+    now_hour = int(time.time()) // 3600
+    since_hour = now_hour - (HISTORY_WEEKS + 1) * HOURS_PER_WEEK
+    # Массивы выделяются заранее по числу строк и заполняются прямо из курсора,
+    # без промежуточного списка кортежей
+    size = OccupancyHistoryDAO.count_hourly_averages(since_hour * 3600)
+    ids = np.empty(size, dtype=np.int64)
+    hours = np.empty(size, dtype=np.int64)
+    values = np.empty(size, dtype=np.float64)
+    count = 0
+    for id_parking, bucket, value in OccupancyHistoryDAO.iter_hourly_averages(since_hour * 3600):
+        if count == size:
+            # Строки, добавленные после подсчёта
+            size = max(2 * size, 1024)
+            ids, hours, values = np.resize(ids, size), np.resize(hours, size), np.resize(values, size)
+        ids[count], hours[count], values[count] = id_parking, bucket // 3600, value
+        count += 1
+    if not count:
+        return
+    parking_ids, predictions = fit(ids[:count], hours[:count], values[:count], now_hour)
+
+    capacities = dict(OccupancyHistoryDAO.get_capacities())
+    limits = np.array(
+        [capacities.get(int(pid)) if capacities.get(int(pid)) is not None else np.inf for pid in parking_ids]
+    )
+    predictions = np.minimum(predictions, limits[:, None])
+
+    pipe = redis.pipeline(transaction=False)
+    for pid, values in zip(parking_ids.tolist(), np.round(predictions, 1).tolist()):
+        pipe.set(forecast_key(pid), json.dumps({
+            "start": now_hour * 3600,
+            "step": 3600,
+            "values": values,
+            "all_spaces": capacities.get(pid),
+        }), ex=FORECAST_HORIZON_HOURS * 3600)
+    pipe.execute()
+    FORECAST_PARKINGS.set(len(parking_ids))
+
+
+def lookup(raw: Optional[str], at: float) -> Optional[dict]:
+    """Прогноз из закэшированного JSON на момент at (epoch) или None вне горизонта."""
+    if raw is None:
+        return None
+    forecast = json.loads(raw)
+    index = int((at - forecast["start"]) // forecast["step"])
+    if not 0 <= index < len(forecast["values"]):
+        return None
+    occupancy = forecast["values"][index]
+    all_spaces = forecast["all_spaces"]
+    return {
+        "occupancy": occupancy,
+        "free_spaces": max(all_spaces - occupancy, 0) if all_spaces is not None else None,
+    }
+
+
+class ForecastJob:
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self):
+        # Lock живёт RETRAIN_INTERVAL и не снимается: он же задаёт расписание для всего кластера
+        if not redis.set(FORECAST_LOCK_KEY, 1, nx=True, ex=RETRAIN_INTERVAL):
+            return
+        with FORECAST_TRAIN_SECONDS.time():
+            train()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Forecast training failed")
+            self._stop.wait(CHECK_INTERVAL)
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="forecast", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+forecast_job = ForecastJob()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    forecast_job._run()
@@ -0,0 +1,66 @@
+"""Общие расчёты сетки карты для запросов по видимой области."""
+import math
+
+# Ниже этого зума in_area-запросы отдают кластеры вместо отдельных объектов
+CLUSTER_MAX_ZOOM = 14
+# Размер ячейки кластеризации в пикселях экрана (тайл — 256 px)
+CLUSTER_CELL_PX = 64
+# Максимум ячеек сетки по каждой оси bbox — ограничивает ответ ~MAX_CLUSTER_GRID² кластерами
+MAX_CLUSTER_GRID = 20
+
+
+def validate_bbox(lat_min: float, lat_max: float, lon_min: float, lon_max: float):
+    """ValueError, если bbox не конечный, перевёрнутый или выходит за пределы координат."""
+    if not all(math.isfinite(v) for v in (lat_min, lat_max, lon_min, lon_max)):
+        raise ValueError("bbox coordinates must be finite")
+    if lat_min > lat_max or lon_min > lon_max:
+        raise ValueError("bbox min must not exceed max")
+    if lat_min < -90 or lat_max > 90 or lon_min < -180 or lon_max > 180:
+        raise ValueError("bbox is out of range")
+
+
+def grid_cell_count(xmin: float, ymin: float, xmax: float, ymax: float, size: float) -> int:
+    """Число ячеек сетки size x size, которые задевает bbox, — без построения их списка."""
+    x0, x1 = math.floor(xmin / size), math.floor(xmax / size)
+    y0, y1 = math.floor(ymin / size), math.floor(ymax / size)
+    return max(x1 - x0 + 1, 0) * max(y1 - y0 + 1, 0)
+
+
+def should_cluster(zoom) -> bool:
+    return zoom is not None and zoom < CLUSTER_MAX_ZOOM
+
+
+def cluster_cell_size(zoom: int, lat_min: float, lat_max: float, lon_min: float, lon_max: float) -> float:
+    """
+    Размер ячейки сетки (в градусах) для ST_SnapToGrid.
+
+    Берём ячейку ~CLUSTER_CELL_PX пикселей на данном зуме, но не мельче, чем
+    bbox / MAX_CLUSTER_GRID — иначе огромный bbox на крупном зуме дал бы
+    неограниченное число кластеров.
+    """
+    cell = 360.0 / (2 ** zoom) * CLUSTER_CELL_PX / 256
+    span = max(lon_max - lon_min, lat_max - lat_min)
+    return max(cell, span / MAX_CLUSTER_GRID)
+
+
+# Уровни детализации полигонов парковок: (минимальный зум, колонка, допуск упрощения в градусах,
+# знаков после запятой в GeoJSON). Допуск ≈ размер пикселя на минимальном зуме уровня.
+# Колонки coordinates_lodN поддерживает ParkingsDAO.create/update (см. migrations/001_parkings_lod.sql).
+PARKING_LODS = (
+    (17, "coordinates", None, 6),
+    (15, "coordinates_lod1", 0.00002, 6),
+    (13, "coordinates_lod2", 0.0001, 5),
+    (0, "coordinates_lod3", 0.0005, 5),
+)
+# Без зума отдаём полную геометрию, но не точнее ~10 см
+DEFAULT_GEOJSON_DIGITS = 6
+
+
+def parking_lod(zoom) -> tuple:
+    """Возвращает (колонка геометрии, maxdecimaldigits) для заданного зума."""
+    if zoom is None:
+        return "coordinates", DEFAULT_GEOJSON_DIGITS
+    for min_zoom, column, _, digits in PARKING_LODS:
+        if zoom >= min_zoom:
+            return column, digits
+    return PARKING_LODS[-1][1], PARKING_LODS[-1][3]
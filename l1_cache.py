@@ -0,0 +1,119 @@
+"""
+In-process L1-кэш перед Redis.
+
+Ограниченный по размеру LRU с TTL на запись: попадание не стоит сетевого похода в
+Redis. Записи, меняющие закэшированные ключи, вызывают invalidate — ключ сразу
+удаляется локально и публикуется в канал L1_INVALIDATION_CHANNEL, откуда его
+удаляют у себя все остальные процессы. TTL записи L1 короткий (не больше
+L1_MAX_TTL), поэтому даже потерянное сообщение pub/sub ограничивает расхождение.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterable, Optional
+
+from prometheus_client import Counter
+
+from redis_client import async_redis_client as async_redis
+from redis_client import redis_client as redis
+
+logger = logging.getLogger(__name__)
+
+L1_INVALIDATION_CHANNEL = "cache:invalidate"
+L1_MAX_SIZE = 10000
+L1_MAX_TTL = 5.0
+
+CACHE_TIER_REQUESTS = Counter("cache_tier_requests_total", "Обращения к уровням кэша", ["tier", "result"])
+
+
+class L1Cache:
+
+    def __init__(self, max_size: int = L1_MAX_SIZE):
+        self._max_size = max_size
+        # key -> (значение, monotonic-время истечения)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # Записи идут и из потоков sync-обработчиков
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                CACHE_TIER_REQUESTS.labels("l1", "hit").inc()
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+        CACHE_TIER_REQUESTS.labels("l1", "miss").inc()
+        return None
+
+    def set(self, key: str, value: Any, ttl: float = L1_MAX_TTL):
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + min(ttl, L1_MAX_TTL))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, keys: Iterable[str]):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def invalidate(self, keys: Iterable[str], pipe=None):
+        """
+        Удаляет ключи локально и рассылает инвалидацию остальным процессам.
+        С pipe публикация добавляется в переданный sync-pipeline вместо отдельного запроса.
+        """
+        keys = list(keys)
+        if not keys:
+            return
+        self.discard(keys)
+        message = json.dumps(keys)
+        if pipe is not None:
+            pipe.publish(L1_INVALIDATION_CHANNEL, message)
+            return
+        try:
+            redis.publish(L1_INVALIDATION_CHANNEL, message)
+        except Exception:
+            logger.exception("L1 invalidation publish failed")
+
+    async def _listen(self):
+        while True:
+            pubsub = async_redis.pubsub()
+            try:
+                await pubsub.subscribe(L1_INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.discard(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Пока подписки нет, инвалидации теряются — сбрасываем L1 целиком
+                with self._lock:
+                    self._entries.clear()
+                logger.exception("L1 invalidation listener failed, reconnecting")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+l1_cache = L1Cache()
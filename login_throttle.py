@@ -0,0 +1,91 @@
+"""
+Ограничение попыток входа token bucket'ами в Redis — по email и по IP клиента.
+
+Проверка обоих bucket'ов — один Lua-скрипт: токен списывается, только если он
+есть в каждом, иначе возвращается время до появления токена. Проверка идёт до
+чтения пользователя из БД и до bcrypt, поэтому волна подбора паролей упирается
+в Redis, а не в CPU. При недоступности Redis вход не блокируется.
+
+За прокси адрес соединения — адрес прокси, поэтому IP клиента берётся из
+X-Forwarded-For: каждый из TRUSTED_PROXY_HOPS доверенных прокси дописывает в конец
+заголовка адрес, с которого к нему пришли, значит клиент — TRUSTED_PROXY_HOPS-я
+запись с конца. Более левые записи присылает сам клиент, им верить нельзя.
+"""
+import logging
+import math
+
+from fastapi import HTTPException, Request, status
+from prometheus_client import Counter
+
+from config import get_settings
+from redis_client import async_redis_client as async_redis
+
+logger = logging.getLogger(__name__)
+
+LOGIN_THROTTLE_REJECTED = Counter("login_throttle_rejected_total", "Отклонённые попытки входа", ["scope"])
+
+# KEYS — bucket'ы; ARGV — тройки (ёмкость, токенов в секунду) на каждый ключ.
+# Возвращает 0, если токены списаны, иначе {номер bucket'а (с 1), мс до нового токена}.
+_TOKEN_BUCKET = async_redis.register_script("""
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local tokens = {}
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2 - 1])
+    local rate = tonumber(ARGV[i * 2]) / 1000
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local value = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    value = math.min(capacity, value + (now - ts) * rate)
+    if value < 1 then
+        return {i, math.ceil((1 - value) / rate)}
+    end
+    tokens[i] = value
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2 - 1])
+    local rate = tonumber(ARGV[i * 2]) / 1000
+    redis.call('HSET', key, 'tokens', tokens[i] - 1, 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(capacity / rate))
+end
+return 0
+""")
+
+_SCOPES = ("email", "ip")
+
+
+def client_ip(request: Request) -> str:
+    hops = get_settings().trusted_proxy_hops
+    if hops > 0:
+        forwarded = [part.strip() for part in request.headers.get("x-forwarded-for", "").split(",") if part.strip()]
+        if len(forwarded) >= hops:
+            return forwarded[-hops]
+    return request.client.host if request.client else "unknown"
+
+
+async def check_login(email: str, client_ip: str):
+    """Списывает попытку входа или поднимает 429 с Retry-After."""
+    settings = get_settings()
+    if not settings.login_throttle_enabled:
+        return
+
+    keys = [f"login:bucket:email:{email.strip().lower()}", f"login:bucket:ip:{client_ip}"]
+    args = [
+        settings.login_email_burst, settings.login_email_per_minute / 60,
+        settings.login_ip_burst, settings.login_ip_per_minute / 60,
+    ]
+    try:
+        result = await _TOKEN_BUCKET(keys=keys, args=args)
+    except Exception:
+        logger.exception("Login throttle check failed")
+        return
+
+    if result == 0:
+        return
+    bucket, retry_after_ms = result
+    LOGIN_THROTTLE_REJECTED.labels(_SCOPES[bucket - 1]).inc()
+    raise HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many login attempts",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after_ms / 1000)))},
+    )
@@ -1,5 +1,22 @@
+import asyncio
+import logging
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import make_asgi_app
+
+from async_database import close_async_pool, init_async_pool
+from auth import listen_token_revocations
+from config import get_settings
+from database import close_pool
+from forecast import forecast_job
+from l1_cache import l1_cache
+from occupancy_buffer import occupancy_buffer
+from occupancy_history import occupancy_history_job
+from occupancy_stream import occupancy_hub
+from password_hashing import close_pool as close_password_pool
+from user_stats import user_stats_job
+from parking_index import parking_index
 from api.parkingsAPI import router as parking_router
 from api.usersAPI import router as user_router
 from api.cvAPI import router as cv_router
@@ -9,6 +26,11 @@ from api.camerasAPI import router as cameras_router
 from api.authAPI import router as auth_router
 from api.simAPI import router as sim_router
 from api.busAPI import router as bus_router
+from api.tilesAPI import router as tiles_router
+from api.occupancyHistoryAPI import router as occupancy_history_router
+from api.forecastAPI import router as forecast_router
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
@@ -19,6 +41,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.mount("/metrics", make_asgi_app())
+
+
+@app.on_event("startup")
+async def startup():
+    try:
+        await init_async_pool()
+    except Exception:
+        # Приложение стартует и без БД: async-обработчики отвечают 503, пока пул
+        # не создастся при первом запросе после её появления
+        logger.exception("Async database pool initialization failed")
+    parking_index.start()
+    occupancy_hub.start()
+    l1_cache.start()
+    app.state.token_revocations = asyncio.create_task(listen_token_revocations())
+    occupancy_history_job.start()
+    if get_settings().forecast_in_app:
+        forecast_job.start()
+    user_stats_job.start()
+    if get_settings().occupancy_write_behind:
+        occupancy_buffer.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await occupancy_hub.stop()
+    await l1_cache.stop()
+    app.state.token_revocations.cancel()
+    occupancy_history_job.stop()
+    forecast_job.stop()
+    user_stats_job.stop()
+    occupancy_buffer.stop()
+    parking_index.stop()
+    close_password_pool()
+    await close_async_pool()
+    close_pool()
+
+
 @app.get("/")
 def home():
     return {"status": "System is running"}
@@ -27,6 +87,9 @@ def home():
 app.include_router(sim_router, prefix="/api", tags=["SIM stops"])
 app.include_router(bus_router, prefix="/api", tags=["Bus"])
 app.include_router(parking_router, prefix="/api", tags=["Parkings"])
+app.include_router(tiles_router, prefix="/api", tags=["Tiles"])
+app.include_router(occupancy_history_router, prefix="/api", tags=["Occupancy history"])
+app.include_router(forecast_router, prefix="/api", tags=["Forecast"])
 app.include_router(parking_space_router, prefix="/parking_spaces", tags=["Parking spaces"])
 app.include_router(favorite_parkings_router, prefix="/favorite_parkings", tags=["Favorite parkings"])
 app.include_router(user_router, prefix="/api", tags=["Users"])
@@ -0,0 +1,12 @@
+-- Упрощённые геометрии парковок для мелких зумов.
+-- Допуски должны совпадать с geo.PARKING_LODS.
+
+ALTER TABLE parkings
+    ADD COLUMN IF NOT EXISTS coordinates_lod1 geometry(Geometry, 4326),
+    ADD COLUMN IF NOT EXISTS coordinates_lod2 geometry(Geometry, 4326),
+    ADD COLUMN IF NOT EXISTS coordinates_lod3 geometry(Geometry, 4326);
+
+UPDATE parkings
+SET coordinates_lod1 = ST_SimplifyPreserveTopology(coordinates, 0.00002),
+    coordinates_lod2 = ST_SimplifyPreserveTopology(coordinates, 0.0001),
+    coordinates_lod3 = ST_SimplifyPreserveTopology(coordinates, 0.0005);
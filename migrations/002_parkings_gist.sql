@@ -0,0 +1,2 @@
+-- GiST-индекс по геометрии парковок: нужен для bbox-запросов и KNN-поиска (оператор <->).
+CREATE INDEX IF NOT EXISTS idx_parkings_coordinates_gist ON parkings USING GIST (coordinates);
@@ -0,0 +1,26 @@
+-- Журнал изменений парковок: по нему процессы инкрементально обновляют
+-- in-memory индекс (parking_index.py). Старые записи чистит сам индекс.
+
+CREATE TABLE IF NOT EXISTS parkings_changes (
+    version bigserial PRIMARY KEY,
+    id_parking integer NOT NULL,
+    changed_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_parkings_changes_changed_at ON parkings_changes (changed_at);
+
+CREATE OR REPLACE FUNCTION log_parkings_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO parkings_changes (id_parking) VALUES (OLD.id);
+        RETURN OLD;
+    END IF;
+    INSERT INTO parkings_changes (id_parking) VALUES (NEW.id);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_parkings_changes ON parkings;
+CREATE TRIGGER trg_parkings_changes
+    AFTER INSERT OR UPDATE OR DELETE ON parkings
+    FOR EACH ROW EXECUTE FUNCTION log_parkings_change();
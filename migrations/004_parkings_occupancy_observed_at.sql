@@ -0,0 +1,5 @@
+-- Время приёма сервером наблюдения, к которому относится текущая occupancy.
+-- Все пути записи (PATCH /cv/occupancy/{id}, write-behind, пакетный PATCH
+-- /cv/occupancy) пишут его по часам сервера и не откатывают более позднее значение.
+
+ALTER TABLE parkings ADD COLUMN IF NOT EXISTS occupancy_observed_at timestamptz;
@@ -0,0 +1,46 @@
+-- История занятости: сырые наблюдения с камер, секционированные по дням, и
+-- агрегаты 1m/1h/1d. Секции на ближайшие дни создаёт и старые удаляет фоновая
+-- задача occupancy_history.py, она же пересчитывает агрегаты.
+
+CREATE TABLE IF NOT EXISTS occupancy_samples (
+    id_parking integer NOT NULL,
+    observed_at timestamptz NOT NULL,
+    occupancy integer NOT NULL
+) PARTITION BY RANGE (observed_at);
+
+-- Наблюдения вне созданных секций (сильно запоздавшие или из будущего) не теряют
+-- запрос целиком; задача периодически их очищает
+CREATE TABLE IF NOT EXISTS occupancy_samples_default PARTITION OF occupancy_samples DEFAULT;
+
+CREATE INDEX IF NOT EXISTS idx_occupancy_samples_observed_at ON occupancy_samples (observed_at);
+
+-- Начальные секции на сегодня и два дня вперёд (границы — полночь UTC), чтобы
+-- первые наблюдения не попали в default-секцию до первого запуска задачи
+DO $$
+DECLARE
+    day date;
+BEGIN
+    FOR offset_days IN 0..2 LOOP
+        day := (now() AT TIME ZONE 'UTC')::date + offset_days;
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF occupancy_samples FOR VALUES FROM (%L) TO (%L)',
+            'occupancy_samples_' || to_char(day, 'YYYYMMDD'),
+            day::text || ' 00:00+00',
+            (day + 1)::text || ' 00:00+00'
+        );
+    END LOOP;
+END $$;
+
+-- samples и occ_sum вместо среднего — чтобы крупные агрегаты точно собирались из мелких
+CREATE TABLE IF NOT EXISTS occupancy_rollups (
+    resolution text NOT NULL CHECK (resolution IN ('1m', '1h', '1d')),
+    id_parking integer NOT NULL,
+    bucket timestamptz NOT NULL,
+    samples integer NOT NULL,
+    occ_min integer NOT NULL,
+    occ_sum bigint NOT NULL,
+    occ_max integer NOT NULL,
+    PRIMARY KEY (resolution, id_parking, bucket)
+);
+
+CREATE INDEX IF NOT EXISTS idx_occupancy_rollups_bucket ON occupancy_rollups (resolution, bucket);
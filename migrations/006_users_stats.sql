@@ -0,0 +1,63 @@
+-- Счётчики пользователей для /api/users/stats вместо COUNT(*) по users.
+-- Поддерживаются statement-level триггерами (одно обновление строки счётчиков
+-- на оператор, в том числе на массовую загрузку), расхождения исправляет
+-- периодическая сверка UsersDAO.reconcile_stats.
+
+CREATE TABLE IF NOT EXISTS users_stats (
+    id boolean PRIMARY KEY DEFAULT true CHECK (id),
+    total bigint NOT NULL,
+    subscribers bigint NOT NULL
+);
+
+INSERT INTO users_stats (id, total, subscribers)
+SELECT true, count(*), count(*) FILTER (WHERE subscription_status)
+FROM users
+ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION users_stats_on_insert() RETURNS trigger AS $$
+BEGIN
+    UPDATE users_stats s
+    SET total = s.total + d.total, subscribers = s.subscribers + d.subscribers
+    FROM (SELECT count(*) AS total, count(*) FILTER (WHERE subscription_status) AS subscribers
+          FROM new_rows) d
+    WHERE d.total > 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION users_stats_on_delete() RETURNS trigger AS $$
+BEGIN
+    UPDATE users_stats s
+    SET total = s.total - d.total, subscribers = s.subscribers - d.subscribers
+    FROM (SELECT count(*) AS total, count(*) FILTER (WHERE subscription_status) AS subscribers
+          FROM old_rows) d
+    WHERE d.total > 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION users_stats_on_update() RETURNS trigger AS $$
+BEGIN
+    UPDATE users_stats s
+    SET subscribers = s.subscribers + d.delta
+    FROM (SELECT (SELECT count(*) FILTER (WHERE subscription_status) FROM new_rows)
+               - (SELECT count(*) FILTER (WHERE subscription_status) FROM old_rows) AS delta) d
+    WHERE d.delta <> 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_users_stats_insert ON users;
+CREATE TRIGGER trg_users_stats_insert
+    AFTER INSERT ON users REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION users_stats_on_insert();
+
+DROP TRIGGER IF EXISTS trg_users_stats_delete ON users;
+CREATE TRIGGER trg_users_stats_delete
+    AFTER DELETE ON users REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION users_stats_on_delete();
+
+DROP TRIGGER IF EXISTS trg_users_stats_update ON users;
+CREATE TRIGGER trg_users_stats_update
+    AFTER UPDATE ON users REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION users_stats_on_update();
@@ -0,0 +1,45 @@
+-- Журнал изменений парковок пишет только изменения полей, попадающих в снимок
+-- parking_index.py. Изменение одной occupancy помечается occupancy_only: снимок
+-- обновляет её на месте, не пересобирая файл. Обновления, не меняющие этих полей
+-- (например, только occupancy_observed_at), в журнал не попадают.
+
+ALTER TABLE parkings_changes ADD COLUMN IF NOT EXISTS occupancy_only boolean NOT NULL DEFAULT false;
+
+CREATE OR REPLACE FUNCTION log_parkings_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO parkings_changes (id_parking) VALUES (OLD.id);
+        RETURN OLD;
+    END IF;
+    INSERT INTO parkings_changes (id_parking, occupancy_only) VALUES (
+        NEW.id,
+        TG_OP = 'UPDATE' AND (
+            OLD.id, OLD.description, OLD.name, OLD.name_obj, OLD.adm_area, OLD.district, OLD.all_spaces,
+            OLD.coordinates, OLD.coordinates_lod1, OLD.coordinates_lod2, OLD.coordinates_lod3
+        ) IS NOT DISTINCT FROM (
+            NEW.id, NEW.description, NEW.name, NEW.name_obj, NEW.adm_area, NEW.district, NEW.all_spaces,
+            NEW.coordinates, NEW.coordinates_lod1, NEW.coordinates_lod2, NEW.coordinates_lod3
+        )
+    );
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_parkings_changes ON parkings;
+DROP TRIGGER IF EXISTS trg_parkings_changes_update ON parkings;
+
+CREATE TRIGGER trg_parkings_changes
+    AFTER INSERT OR DELETE ON parkings
+    FOR EACH ROW EXECUTE FUNCTION log_parkings_change();
+
+CREATE TRIGGER trg_parkings_changes_update
+    AFTER UPDATE ON parkings
+    FOR EACH ROW
+    WHEN ((
+        OLD.id, OLD.description, OLD.name, OLD.name_obj, OLD.adm_area, OLD.district, OLD.all_spaces,
+        OLD.coordinates, OLD.coordinates_lod1, OLD.coordinates_lod2, OLD.coordinates_lod3, OLD.occupancy
+    ) IS DISTINCT FROM (
+        NEW.id, NEW.description, NEW.name, NEW.name_obj, NEW.adm_area, NEW.district, NEW.all_spaces,
+        NEW.coordinates, NEW.coordinates_lod1, NEW.coordinates_lod2, NEW.coordinates_lod3, NEW.occupancy
+    ))
+    EXECUTE FUNCTION log_parkings_change();
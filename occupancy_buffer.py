@@ -0,0 +1,124 @@
+"""
+Write-behind буфер занятости парковок для потока данных с камер.
+
+PATCH /cv/occupancy/{id} в этом режиме только кладёт значение в Redis и в буфер
+процесса и сразу отвечает. Фоновый поток раз в OCCUPANCY_FLUSH_INTERVAL_MS
+забирает буфер — по каждой парковке остаётся последнее значение — и пишет его в
+БД одним UPDATE ... FROM (VALUES ...). Строки, где значение не изменилось, UPDATE
+пропускает и не порождает лишних версий строк и записей в parkings_changes; значения,
+принятые раньше уже записанного (например, пакетом с камер), тоже.
+После коммита пачки поколения её ключей в swr_cache сменяются: фоновая загрузка,
+успевшая прочитать из БД старое значение, не перезапишет им кэш.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from prometheus_client import Counter, Histogram
+
+import bbox_cache
+import occupancy_stream
+import swr_cache
+from config import get_settings
+from dao.cv_dao import CvDAO
+from redis_client import redis_client as redis
+
+logger = logging.getLogger(__name__)
+
+OCCUPANCY_FLUSH_INTERVAL = get_settings().occupancy_flush_interval_ms / 1000
+
+OCCUPANCY_FLUSH_LAG = Histogram(
+    "occupancy_flush_lag_seconds",
+    "Время от самого старого обновления в пачке до его записи в БД",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+OCCUPANCY_FLUSH_BATCH = Histogram(
+    "occupancy_flush_batch_size",
+    "Парковок в одной пачке записи",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500),
+)
+OCCUPANCY_UPDATES = Counter(
+    "occupancy_updates_total",
+    "Обновления занятости, прошедшие через буфер",
+    ["result"],
+)
+
+
+class OccupancyBuffer:
+
+    def __init__(self):
+        # id_parking -> (occupancy, время первого необработанного обновления, время приёма последнего)
+        self._pending: Dict[int, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def put(self, id_parking: int, occupancy: int):
+        # Время приёма — по нему БД решает, какое из наблюдений новее (см. CvDAO.apply_observations)
+        received_at = datetime.now(timezone.utc)
+        with self._lock:
+            pending = self._pending.get(id_parking)
+            queued_at = pending[1] if pending is not None else time.monotonic()
+            self._pending[id_parking] = (occupancy, queued_at, received_at)
+        OCCUPANCY_UPDATES.labels("coalesced" if pending is not None else "buffered").inc()
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return
+
+        try:
+            rows = CvDAO.update_occupancy_batch(
+                [(pid, occ, received_at) for pid, (occ, _, received_at) in batch.items()]
+            )
+        except Exception:
+            # Возвращаем пачку в буфер, не затирая более свежие значения
+            with self._lock:
+                for pid, entry in batch.items():
+                    self._pending.setdefault(pid, entry)
+            raise
+
+        try:
+            pipe = redis.pipeline(transaction=False)
+            swr_cache.bump_generations([f"parking:{pid}:occupancy" for pid in batch], pipe)
+            pipe.execute()
+        except Exception:
+            logger.exception("Occupancy cache generation bump failed")
+
+        OCCUPANCY_FLUSH_BATCH.observe(len(batch))
+        OCCUPANCY_FLUSH_LAG.observe(time.monotonic() - min(queued_at for _, queued_at, _ in batch.values()))
+        OCCUPANCY_UPDATES.labels("written").inc(len(rows))
+        # Совпавшие с БД значения (и несуществующие парковки) UPDATE отфильтровал сам
+        OCCUPANCY_UPDATES.labels("unchanged").inc(len(batch) - len(rows))
+        bbox_cache.invalidate(*(row[1:] for row in rows))
+        occupancy_stream.publish((row[0], batch[row[0]][0], row[1:]) for row in rows)
+
+    def _run(self):
+        while not self._stop.wait(OCCUPANCY_FLUSH_INTERVAL):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Occupancy flush failed")
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="occupancy-flusher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Останавливает поток и дописывает то, что осталось в буфере."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Occupancy flush on shutdown failed")
+
+
+occupancy_buffer = OccupancyBuffer()
@@ -0,0 +1,86 @@
+"""
+Фоновое обслуживание истории занятости (см. migrations/005_occupancy_history.sql).
+
+Раз в ROLLUP_INTERVAL пересчитывает агрегаты 1m/1h/1d за последний
+ROLLUP_LATE_WINDOW, заранее создаёт дневные секции сырых наблюдений и удаляет
+данные старше срока хранения. Запускается в каждом воркере, но пересчёт
+под advisory lock выполняет только один из них за раз.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from dao.occupancy_history_dao import OccupancyHistoryDAO
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_INTERVAL = 60.0
+# Запоздавшие до этого времени наблюдения попадают в агрегаты
+ROLLUP_LATE_WINDOW = 3600
+MAINTENANCE_INTERVAL = 3600.0
+PARTITIONS_AHEAD_DAYS = 2
+RAW_RETENTION_DAYS = 7
+ROLLUP_RETENTION_SECONDS = {
+    "1m": 30 * 86400,
+    "1h": 400 * 86400,
+}
+
+
+class OccupancyHistoryJob:
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # -inf: первое обслуживание — сразу при старте, как бы мал ни был monotonic()
+        self._last_maintenance = float("-inf")
+
+    def ensure_partitions(self):
+        """Секции с сегодняшнего дня (UTC) на PARTITIONS_AHEAD_DAYS вперёд; ошибка одной не мешает остальным."""
+        today = datetime.now(timezone.utc).date()
+        for offset in range(PARTITIONS_AHEAD_DAYS + 1):
+            day = today + timedelta(days=offset)
+            try:
+                OccupancyHistoryDAO.create_partition(day)
+            except Exception:
+                logger.exception("Failed to create occupancy_samples partition for %s", day)
+
+    def maintain(self):
+        self.ensure_partitions()
+        try:
+            OccupancyHistoryDAO.drop_partitions(RAW_RETENTION_DAYS)
+            OccupancyHistoryDAO.prune_rollups(ROLLUP_RETENTION_SECONDS)
+        except Exception:
+            logger.exception("Occupancy history cleanup failed")
+
+    def run_once(self):
+        # Обслуживание не должно останавливать пересчёт агрегатов: сбой в нём
+        # логируется, а следующая попытка будет через MAINTENANCE_INTERVAL
+        if time.monotonic() - self._last_maintenance > MAINTENANCE_INTERVAL:
+            self._last_maintenance = time.monotonic()
+            self.maintain()
+        OccupancyHistoryDAO.rollup(ROLLUP_LATE_WINDOW)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Occupancy rollup failed")
+            self._stop.wait(ROLLUP_INTERVAL)
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="occupancy-history", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+occupancy_history_job = OccupancyHistoryJob()
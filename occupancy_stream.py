@@ -0,0 +1,212 @@
+"""
+Push изменений занятости клиентам по WebSocket/SSE.
+
+Все пути записи occupancy публикуют изменения (id, occupancy, bbox) в Redis-канал
+OCCUPANCY_CHANNEL, поэтому событие видит каждый экземпляр API. В каждом процессе
+OccupancyHub слушает канал и раскладывает события по подпискам: подписки на bbox
+проиндексированы по сетке GRID_SIZE, подписки на id — по id, так что событие
+проверяется только против подписок из своих ячеек. Подписка копит изменения в
+словаре по id (новое значение затирает старое), а соединение отправляет накопленное
+не чаще раза в PUSH_INTERVAL — медленный клиент не тормозит рассылку.
+"""
+import asyncio
+import json
+import logging
+import math
+from typing import Iterable, List, Optional, Set
+
+from prometheus_client import Counter, Gauge
+
+from geo import grid_cell_count, validate_bbox
+from redis_client import async_redis_client as async_redis
+from redis_client import redis_client as redis
+
+logger = logging.getLogger(__name__)
+
+OCCUPANCY_CHANNEL = "parkings:occupancy"
+GRID_SIZE = 0.01
+# Подписка на bbox не больше ~0.5° x 0.5°
+MAX_SUBSCRIPTION_CELLS = 2500
+MAX_SUBSCRIPTION_IDS = 500
+# Минимальный интервал между сообщениями одному клиенту
+PUSH_INTERVAL = 0.5
+# Без изменений SSE-соединение получает комментарий-heartbeat с этим интервалом
+HEARTBEAT_INTERVAL = 15.0
+
+OCCUPANCY_STREAM_CONNECTIONS = Gauge("occupancy_stream_connections", "Открытые push-соединения", ["transport"])
+OCCUPANCY_STREAM_EVENTS = Counter("occupancy_stream_events_total", "Изменения занятости, полученные из Redis")
+OCCUPANCY_STREAM_DELIVERIES = Counter("occupancy_stream_deliveries_total", "Изменения, поставленные в подписки")
+
+
+def _cells(xmin: float, ymin: float, xmax: float, ymax: float) -> List[tuple]:
+    x0, x1 = math.floor(xmin / GRID_SIZE), math.floor(xmax / GRID_SIZE)
+    y0, y1 = math.floor(ymin / GRID_SIZE), math.floor(ymax / GRID_SIZE)
+    return [(cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)]
+
+
+def publish(updates: Iterable[tuple]):
+    """Публикует изменения (id_parking, occupancy, bbox) одним сообщением."""
+    events = [
+        {"id": pid, "occupancy": occupancy, "bbox": list(bbox) if bbox is not None else None}
+        for pid, occupancy, bbox in updates
+    ]
+    if not events:
+        return
+    try:
+        redis.publish(OCCUPANCY_CHANNEL, json.dumps(events))
+    except Exception:
+        logger.exception("Occupancy publish failed")
+
+
+def parse_subscription(bbox: Optional[list], ids: Optional[list]) -> tuple:
+    """
+    Проверяет подписку: bbox — [lat_min, lat_max, lon_min, lon_max], ids — список id.
+    Возвращает (bbox как (xmin, ymin, xmax, ymax) или None, frozenset id), ValueError при ошибке.
+    """
+    if bbox is None and not ids:
+        raise ValueError("Subscription needs a bbox or ids")
+
+    box = None
+    if bbox is not None:
+        try:
+            lat_min, lat_max, lon_min, lon_max = (float(v) for v in bbox)
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError("bbox must be [lat_min, lat_max, lon_min, lon_max]")
+        validate_bbox(lat_min, lat_max, lon_min, lon_max)
+        box = (lon_min, lat_min, lon_max, lat_max)
+        # Ячейки считаются без построения списка — огромный bbox отклоняется сразу
+        if grid_cell_count(*box, GRID_SIZE) > MAX_SUBSCRIPTION_CELLS:
+            raise ValueError("bbox is too large")
+
+    try:
+        id_set = frozenset(int(pid) for pid in ids or ())
+    except (TypeError, ValueError):
+        raise ValueError("ids must be integers")
+    if len(id_set) > MAX_SUBSCRIPTION_IDS:
+        raise ValueError(f"Too many ids (max {MAX_SUBSCRIPTION_IDS})")
+    return box, id_set
+
+
+class Subscription:
+
+    def __init__(self):
+        self.bbox: Optional[tuple] = None
+        self.ids: frozenset = frozenset()
+        self.closed = False
+        # id_parking -> последняя ещё не отправленная занятость
+        self._pending = {}
+        self._ready = asyncio.Event()
+
+    def matches(self, bbox) -> bool:
+        if self.bbox is None or bbox is None:
+            return False
+        xmin, ymin, xmax, ymax = self.bbox
+        return bbox[0] <= xmax and bbox[2] >= xmin and bbox[1] <= ymax and bbox[3] >= ymin
+
+    def push(self, pid: int, occupancy: int):
+        self._pending[pid] = occupancy
+        self._ready.set()
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+    async def next_batch(self, timeout: float) -> Optional[list]:
+        """Накопленные изменения или None по таймауту/закрытию."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._ready.clear()
+        if self.closed:
+            return None
+        batch, self._pending = self._pending, {}
+        return [{"id_parking": pid, "occupancy": occupancy} for pid, occupancy in batch.items()]
+
+
+class OccupancyHub:
+
+    def __init__(self):
+        self._by_cell = {}
+        self._by_id = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, bbox: Optional[tuple] = None, ids: Iterable[int] = ()) -> Subscription:
+        subscription = Subscription()
+        self.update(subscription, bbox, ids)
+        return subscription
+
+    def update(self, subscription: Subscription, bbox: Optional[tuple], ids: Iterable[int]):
+        self._unindex(subscription)
+        subscription.bbox = bbox
+        subscription.ids = frozenset(ids)
+        if bbox is not None:
+            for cell in _cells(*bbox):
+                self._by_cell.setdefault(cell, set()).add(subscription)
+        for pid in subscription.ids:
+            self._by_id.setdefault(pid, set()).add(subscription)
+
+    def unsubscribe(self, subscription: Subscription):
+        self._unindex(subscription)
+        subscription.close()
+
+    def _unindex(self, subscription: Subscription):
+        if subscription.bbox is not None:
+            for cell in _cells(*subscription.bbox):
+                self._discard(self._by_cell, cell, subscription)
+        for pid in subscription.ids:
+            self._discard(self._by_id, pid, subscription)
+
+    @staticmethod
+    def _discard(index: dict, key, subscription: Subscription):
+        subscriptions = index.get(key)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del index[key]
+
+    def dispatch(self, events: list):
+        for event in events:
+            pid, occupancy, bbox = event["id"], event["occupancy"], event.get("bbox")
+            targets: Set[Subscription] = set(self._by_id.get(pid, ()))
+            if bbox is not None:
+                for cell in _cells(*bbox):
+                    for subscription in self._by_cell.get(cell, ()):
+                        if subscription not in targets and subscription.matches(bbox):
+                            targets.add(subscription)
+            for subscription in targets:
+                subscription.push(pid, occupancy)
+            OCCUPANCY_STREAM_DELIVERIES.inc(len(targets))
+        OCCUPANCY_STREAM_EVENTS.inc(len(events))
+
+    async def _listen(self):
+        while True:
+            pubsub = async_redis.pubsub()
+            try:
+                await pubsub.subscribe(OCCUPANCY_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.dispatch(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Occupancy stream listener failed, reconnecting")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+occupancy_hub = OccupancyHub()
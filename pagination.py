@@ -0,0 +1,70 @@
+"""Keyset-пагинация для списочных эндпоинтов и жёсткий лимит для in_area."""
+import base64
+import binascii
+import json
+import uuid
+from typing import Any, Callable, List, Optional, Sequence
+
+from fastapi import HTTPException
+
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Максимум объектов в одном ответе in_area, остальное отбрасывается с truncated=True
+IN_AREA_LIMIT = 2000
+
+
+def encode_cursor(after_id: Any) -> str:
+    raw = json.dumps({"after_id": after_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _check_key(value: Any, key_type: type) -> Any:
+    """Ключ нужного типа (int или строка с uuid) или ValueError — до того, как он уйдёт в SQL."""
+    if key_type is int and isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if key_type is uuid.UUID and isinstance(value, str):
+        uuid.UUID(value)
+        return value
+    raise ValueError(f"after_id must be {key_type.__name__}")
+
+
+def decode_cursor(cursor: str, key_type: type = int) -> Any:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return _check_key(json.loads(base64.urlsafe_b64decode(padded))["after_id"], key_type)
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def resolve_after_id(after_id: Optional[Any], cursor: Optional[str], key_type: type = int) -> Optional[Any]:
+    """
+    Непрозрачный cursor имеет приоритет над явным after_id. key_type — тип ключа
+    пагинации: int или uuid.UUID (ключ передаётся дальше строкой).
+    """
+    if cursor is not None:
+        return decode_cursor(cursor, key_type)
+    if after_id is not None:
+        try:
+            return _check_key(after_id, key_type)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid after_id")
+    return after_id
+
+
+def make_page(rows: Sequence, limit: int, to_item: Callable, key: Callable) -> dict:
+    """
+    Собирает страницу из rows, запрошенных с LIMIT limit + 1: лишняя строка
+    означает, что есть следующая страница.
+    """
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    items: List = [to_item(row) for row in rows]
+    return {
+        "items": items,
+        "next_cursor": encode_cursor(key(rows[-1])) if has_more and rows else None,
+    }
+
+
+def truncate(items: List, limit: int = IN_AREA_LIMIT) -> dict:
+    return {"items": items[:limit], "truncated": len(items) > limit}
@@ -0,0 +1,193 @@
+"""
+Индекс парковок для /parkings/in_area без обращения к БД.
+
+Данные лежат в файле-снимке parking_snapshot (bbox, occupancy и уже сериализованный
+JSON объекта под каждый уровень детализации из geo.PARKING_LODS), который каждый
+воркер отображает в память только на чтение — одна копия на хост. Снимок строит
+один воркер на хосте, захвативший flock: при старте целиком, дальше дописывает
+изменения из parkings_changes по версии и атомарно подменяет файл. Остальные воркеры
+лишь переоткрывают файл, когда он сменился, поэтому новый воркер прогрет сразу.
+Изменения одной occupancy не пересобирают снимок: сборщик пишет их в файл на месте.
+Пока снимка нет или он давно не обновлялся, in_area идёт мимо индекса.
+"""
+import fcntl
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import List, Optional
+
+from prometheus_client import Counter, Gauge
+
+import parking_snapshot
+from config import get_settings
+from dao.parkings_dao import ParkingsDAO
+from geo import PARKING_LODS, parking_lod
+
+logger = logging.getLogger(__name__)
+
+REFRESH_INTERVAL = 1.0
+# Как часто воркер-сборщик подтягивает изменения и переписывает снимок
+BUILD_INTERVAL = 2.0
+# Снимок не используется, если файл не обновлялся дольше этого времени
+STALE_AFTER = 10.0
+CHANGES_OVERLAP_SECONDS = 10
+# Журнал изменений хранится час; если снимок отстал больше чем на половину срока — полная пересборка
+CHANGES_RETENTION_SECONDS = 3600
+PRUNE_INTERVAL = 300
+
+PARKING_INDEX_SIZE = Gauge("parking_index_size", "Парковок в снимке индекса")
+PARKING_INDEX_LAG = Gauge("parking_index_lag_seconds", "Время с последнего обновления файла снимка")
+PARKING_INDEX_QUERIES = Counter("parking_index_queries_total", "Запросы in_area к индексу", ["result"])
+
+_LOD_POSITION = {column: i for i, (_, column, _, _) in enumerate(PARKING_LODS)}
+
+
+def _default_snapshot_path() -> str:
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, "parkings.snapshot")
+
+
+def _to_record(row) -> parking_snapshot.Record:
+    return row[0], tuple(row[1:5]), row[5], tuple(item.encode() for item in row[6:])
+
+
+class ParkingIndex:
+
+    def __init__(self, path: Optional[str] = None):
+        self._path = path or get_settings().parking_snapshot_path or _default_snapshot_path()
+        self._snapshot: Optional[parking_snapshot.Snapshot] = None
+        self._mtime = 0.0
+        self._lock_file = None
+        self._last_build = 0.0
+        self._last_prune = time.monotonic()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        PARKING_INDEX_SIZE.set_function(lambda: len(self._snapshot) if self._snapshot else 0)
+        PARKING_INDEX_LAG.set_function(
+            lambda: time.time() - self._mtime if self._snapshot else float("inf")
+        )
+
+    def is_ready(self) -> bool:
+        return self._snapshot is not None and time.time() - self._mtime < STALE_AFTER
+
+    def _is_builder(self) -> bool:
+        """Сборщиком становится тот воркер, кто первым возьмёт flock; его смерть освобождает lock."""
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self._path + ".lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def build(self):
+        """Полная сборка снимка. Версию берём до чтения таблицы — изменения во время сборки догонит refresh."""
+        version = ParkingsDAO.get_changes_version()
+        rows = (_to_record(row) for row in ParkingsDAO.iter_index_rows())
+        parking_snapshot.write(self._path, rows, version, len(PARKING_LODS))
+
+    def update(self):
+        """
+        Дописывает в снимок изменения из журнала: изменённые целиком парковки — новой
+        версией файла, изменения только occupancy — на месте. Без изменений лишь
+        продлевает свежесть снимка.
+        """
+        snapshot = self._snapshot
+        if snapshot is None or time.time() - self._mtime > CHANGES_RETENTION_SECONDS / 2:
+            self.build()
+            return
+
+        version, ids, occupancy_ids = ParkingsDAO.get_changes(snapshot.version, CHANGES_OVERLAP_SECONDS)
+        if ids:
+            ids += occupancy_ids
+            changed = [_to_record(row) for row in ParkingsDAO.iter_index_rows(ids)]
+            records = parking_snapshot.merge(snapshot, changed, ids)
+            parking_snapshot.write(self._path, records, version, len(PARKING_LODS))
+        elif occupancy_ids or version != snapshot.version:
+            occupancies = ParkingsDAO.get_occupancies(occupancy_ids) if occupancy_ids else []
+            parking_snapshot.patch_occupancy(self._path, snapshot, occupancies, version)
+        else:
+            os.utime(self._path)
+
+    def reload(self):
+        """Переоткрывает файл, если его подменили. Старый mmap не закрываем — его могут читать запросы."""
+        try:
+            stat = os.stat(self._path)
+        except FileNotFoundError:
+            return
+        if self._snapshot is None or stat.st_ino != self._snapshot.inode:
+            try:
+                self._snapshot = parking_snapshot.Snapshot(self._path)
+            except ValueError:
+                # Файл другого формата (от прошлой версии приложения) — сборщик перепишет его
+                logger.warning("Ignoring incompatible parking snapshot %s", self._path)
+                return
+        self._mtime = stat.st_mtime
+
+    def refresh(self):
+        self.reload()
+        if not self._is_builder() or time.monotonic() - self._last_build < BUILD_INTERVAL:
+            return
+        self.update()
+        self._last_build = time.monotonic()
+        self.reload()
+        if time.monotonic() - self._last_prune > PRUNE_INTERVAL:
+            ParkingsDAO.prune_changes(CHANGES_RETENTION_SECONDS)
+            self._last_prune = time.monotonic()
+
+    def query(self, lat_min: float, lat_max: float, lon_min: float, lon_max: float,
+              zoom: Optional[int]) -> List[bytes]:
+        """JSON объектов, чей bbox пересекает запрошенный, отсортированные по id."""
+        column, _ = parking_lod(zoom)
+        return self._snapshot.query(lat_min, lat_max, lon_min, lon_max, _LOD_POSITION[column])
+
+    def in_area_json(self, lat_min: float, lat_max: float, lon_min: float, lon_max: float,
+                     zoom: Optional[int], limit: int) -> Optional[bytes]:
+        """
+        Готовое тело ответа in_area ({"items": [...], "truncated": ...}) из
+        сериализованных объектов или None, если снимка ещё нет или он устарел.
+        """
+        if not self.is_ready():
+            PARKING_INDEX_QUERIES.labels("fallback").inc()
+            return None
+        found = self.query(lat_min, lat_max, lon_min, lon_max, zoom)
+        PARKING_INDEX_QUERIES.labels("hit").inc()
+        truncated = b"true" if len(found) > limit else b"false"
+        return b'{"items":[' + b",".join(found[:limit]) + b'],"truncated":' + truncated + b"}"
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Parking index refresh failed")
+            self._stop.wait(REFRESH_INTERVAL)
+
+    def start(self):
+        if self._thread is None:
+            try:
+                # Уже собранный снимок доступен сразу, до первого прохода фонового потока
+                self.reload()
+            except Exception:
+                logger.exception("Parking snapshot load failed")
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="parking-index", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+parking_index = ParkingIndex()
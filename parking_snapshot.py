@@ -0,0 +1,198 @@
+"""
+Компактный снимок парковок в файле, общий для всех воркеров на хосте.
+
+Файл состоит из заголовка и плоских массивов (ids, bbox, occupancy, смещения в
+блоб сериализованных объектов, упакованная сетка ячеек) и читается через mmap
+только на чтение — страницы лежат в page cache один раз на хост. Новая версия
+пишется во временный файл и подменяется атомарным os.replace, поэтому читатели
+всегда видят целостный снимок.
+
+Сериализованные объекты хранятся без occupancy: она лежит отдельным массивом и
+дописывается в конец объекта при чтении. Поэтому изменение одной занятости не
+пересобирает файл — patch_occupancy пишет новое значение прямо в него, и
+читатели видят его через свой mmap.
+"""
+import heapq
+import math
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left
+from typing import Iterable, List, Optional, Tuple
+
+from geo import grid_cell_count
+
+MAGIC = b"PKSNAP02"
+# magic, версия журнала parkings_changes, записей, ячеек, ссылок из ячеек, LOD на запись, длина блоба
+HEADER = struct.Struct("<8s6q")
+HEADER_SIZE = 64
+HEADER_VERSION_OFFSET = 8
+OCCUPANCY = struct.Struct("<i")
+GRID_SIZE = 0.01
+
+# Запись снимка: (id, (xmin, ymin, xmax, ymax), occupancy, (json объекта без occupancy для каждого LOD))
+Record = Tuple[int, tuple, Optional[int], tuple]
+
+
+def cells(xmin: float, ymin: float, xmax: float, ymax: float) -> List[int]:
+    x0, x1 = math.floor(xmin / GRID_SIZE), math.floor(xmax / GRID_SIZE)
+    y0, y1 = math.floor(ymin / GRID_SIZE), math.floor(ymax / GRID_SIZE)
+    return [_cell_key(cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)]
+
+
+def _cell_key(cx: int, cy: int) -> int:
+    return ((cx + (1 << 20)) << 21) | (cy + (1 << 20))
+
+
+def _pad(length: int) -> int:
+    return -length % 8
+
+
+class Snapshot:
+    """Снимок, отображённый в память. Все массивы — memoryview поверх mmap, без копий."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.inode = stat.st_ino
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        view = memoryview(self._mm)
+        magic, self.version, n, n_cells, n_refs, self.lod_count, blob_len = HEADER.unpack_from(view, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a parking snapshot")
+
+        pos = HEADER_SIZE
+
+        def take(fmt: str, count: int):
+            nonlocal pos
+            size = struct.calcsize(fmt) * count
+            arr = view[pos:pos + size].cast(fmt)
+            pos += size + _pad(size)
+            return arr
+
+        self.ids = take("q", n)
+        self.bboxes = take("d", n * 4)
+        self.occupancy_offset = pos
+        self.occupancy = take("i", n)
+        self.offsets = take("q", n * self.lod_count + 1)
+        self.cell_keys = take("q", n_cells)
+        self.cell_starts = take("q", n_cells + 1)
+        self.cell_refs = take("i", n_refs)
+        self.blob = view[pos:pos + blob_len]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def item(self, position: int, lod: int) -> memoryview:
+        i = position * self.lod_count + lod
+        return self.blob[self.offsets[i]:self.offsets[i + 1]]
+
+    def position(self, pid: int) -> Optional[int]:
+        i = bisect_left(self.ids, pid)
+        return i if i < len(self.ids) and self.ids[i] == pid else None
+
+    def records(self, skip_ids: frozenset = frozenset()) -> Iterable[Record]:
+        for position, pid in enumerate(self.ids):
+            if pid in skip_ids:
+                continue
+            b = position * 4
+            occupancy = self.occupancy[position]
+            yield (
+                pid,
+                tuple(self.bboxes[b:b + 4]),
+                None if occupancy < 0 else occupancy,
+                tuple(self.item(position, lod) for lod in range(self.lod_count)),
+            )
+
+    def query(self, lat_min: float, lat_max: float, lon_min: float, lon_max: float, lod: int) -> List[bytes]:
+        """JSON объектов, чей bbox пересекает запрошенный, по возрастанию id."""
+        # Число ячеек bbox считается до построения их списка: для bbox больше занятой
+        # части сетки дешевле пройти все записи
+        if grid_cell_count(lon_min, lat_min, lon_max, lat_max, GRID_SIZE) > len(self.cell_keys):
+            candidates = range(len(self.ids))
+        else:
+            candidates = set()
+            for key in cells(lon_min, lat_min, lon_max, lat_max):
+                i = bisect_left(self.cell_keys, key)
+                if i < len(self.cell_keys) and self.cell_keys[i] == key:
+                    candidates.update(self.cell_refs[self.cell_starts[i]:self.cell_starts[i + 1]])
+            candidates = sorted(candidates)
+
+        bboxes, occupancy = self.bboxes, self.occupancy
+        result = []
+        for position in candidates:
+            b = position * 4
+            if (bboxes[b] <= lon_max and bboxes[b + 2] >= lon_min
+                    and bboxes[b + 1] <= lat_max and bboxes[b + 3] >= lat_min):
+                occ = occupancy[position]
+                item = self.item(position, lod)
+                result.append(
+                    b"".join((item[:-1], b',"occupancy":', b"null" if occ < 0 else str(occ).encode(), b"}"))
+                )
+        return result
+
+
+def write(path: str, records: Iterable[Record], version: int, lod_count: int):
+    """Пишет снимок из записей, отсортированных по id, и атомарно подменяет файл."""
+    ids, bboxes, occupancy, offsets = array("q"), array("d"), array("i"), array("q", [0])
+    grid = {}
+    blob_parts = []
+    blob_len = 0
+
+    for position, (pid, bbox, occ, items) in enumerate(records):
+        ids.append(pid)
+        bboxes.extend(bbox)
+        occupancy.append(-1 if occ is None else int(occ))
+        for item in items:
+            blob_parts.append(item)
+            blob_len += len(item)
+            offsets.append(blob_len)
+        for key in cells(*bbox):
+            grid.setdefault(key, []).append(position)
+
+    cell_keys, cell_starts, cell_refs = array("q"), array("q", [0]), array("i")
+    for key in sorted(grid):
+        cell_keys.append(key)
+        cell_refs.extend(grid[key])
+        cell_starts.append(len(cell_refs))
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        header = HEADER.pack(MAGIC, version, len(ids), len(cell_keys), len(cell_refs), lod_count, blob_len)
+        f.write(header + b"\0" * (HEADER_SIZE - len(header)))
+        for arr in (ids, bboxes, occupancy, offsets, cell_keys, cell_starts, cell_refs):
+            data = arr.tobytes()
+            f.write(data + b"\0" * _pad(len(data)))
+        for part in blob_parts:
+            f.write(part)
+    os.replace(tmp_path, path)
+
+
+def patch_occupancy(path: str, snapshot: Snapshot, occupancies: Iterable[Tuple[int, Optional[int]]], version: int):
+    """
+    Записывает новые occupancy прямо в файл снимка (тот же inode, что отображён у
+    читателей) и версию журнала в заголовок. Парковки, которых нет в снимке, пропускаются.
+    """
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        if os.fstat(fd).st_ino != snapshot.inode:
+            raise ValueError(f"{path} was replaced, patch the new snapshot instead")
+        for pid, occ in occupancies:
+            position = snapshot.position(pid)
+            if position is not None:
+                os.pwrite(fd, OCCUPANCY.pack(-1 if occ is None else int(occ)), snapshot.occupancy_offset + 4 * position)
+        os.pwrite(fd, struct.pack("<q", version), HEADER_VERSION_OFFSET)
+    finally:
+        os.close(fd)
+    snapshot.version = version
+
+
+def merge(old: Snapshot, changed: Iterable[Record], changed_ids: Iterable[int]) -> Iterable[Record]:
+    """
+    Записи нового снимка: старые (кроме изменённых и удалённых) плюс свежие строки.
+    Объекты старого снимка не копируются — это срезы его mmap.
+    """
+    fresh = sorted(changed, key=lambda record: record[0])
+    return heapq.merge(old.records(frozenset(changed_ids)), fresh, key=lambda record: record[0])
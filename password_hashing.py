@@ -0,0 +1,133 @@
+"""
+Хэширование и проверка паролей bcrypt в отдельном пуле процессов.
+
+Каждый вызов bcrypt — 100–300 мс CPU. В пуле процессов он не держит GIL воркера и
+поток его threadpool, поэтому всплеск логинов не замедляет картографические
+запросы. Пул ограничен по размеру, очередь — по длине (PASSWORD_HASH_MAX_PENDING):
+сверх неё запрос сразу получает 503, как и при ожидании дольше PASSWORD_HASH_TIMEOUT.
+"""
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from prometheus_client import Counter, Gauge, Histogram
+
+from config import get_settings
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+PASSWORD_HASH_PENDING = Gauge("password_hash_pending", "Операции bcrypt в очереди и в работе")
+PASSWORD_HASH_SECONDS = Histogram(
+    "password_hash_seconds",
+    "Время операции bcrypt в процессе пула",
+    ["op"],
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0),
+)
+PASSWORD_HASH_WAIT_SECONDS = Histogram(
+    "password_hash_wait_seconds",
+    "Полное время ожидания результата bcrypt, включая очередь",
+    ["op"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+PASSWORD_HASH_REJECTED = Counter("password_hash_rejected_total", "Отклонённые операции bcrypt", ["reason"])
+
+# Пароли массового импорта хэшируются пачками такого размера: одна пачка ~1–2 с,
+# поэтому логины, вставшие в очередь пула за ней, укладываются в таймаут
+IMPORT_HASH_CHUNK = 8
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pending = 0
+# Пачки импорта в пуле — общий лимит на все запросы импорта процесса
+_import_slots: Optional[asyncio.Semaphore] = None
+
+
+def _hash(password: str) -> tuple:
+    started = time.perf_counter()
+    return pwd_context.hash(password), time.perf_counter() - started
+
+
+def _verify(password: str, password_hash: str) -> tuple:
+    started = time.perf_counter()
+    return pwd_context.verify(password, password_hash), time.perf_counter() - started
+
+
+def _hash_many(passwords: list) -> tuple:
+    started = time.perf_counter()
+    return [pwd_context.hash(password) for password in passwords], time.perf_counter() - started
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: воркер API к этому моменту уже многопоточный, fork из него небезопасен
+        _pool = ProcessPoolExecutor(
+            max_workers=get_settings().password_hash_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def close_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def _run(op: str, fn, *args):
+    global _pending
+    settings = get_settings()
+    if _pending >= settings.password_hash_max_pending:
+        PASSWORD_HASH_REJECTED.labels("queue_full").inc()
+        raise HTTPException(status_code=503, detail="Too many authentication requests, retry later")
+
+    _pending += 1
+    PASSWORD_HASH_PENDING.set(_pending)
+    started = time.perf_counter()
+    try:
+        future = asyncio.get_running_loop().run_in_executor(get_pool(), fn, *args)
+        result, elapsed = await asyncio.wait_for(future, settings.password_hash_timeout)
+    except asyncio.TimeoutError:
+        PASSWORD_HASH_REJECTED.labels("timeout").inc()
+        raise HTTPException(status_code=503, detail="Authentication timed out, retry later")
+    finally:
+        _pending -= 1
+        PASSWORD_HASH_PENDING.set(_pending)
+        PASSWORD_HASH_WAIT_SECONDS.labels(op).observe(time.perf_counter() - started)
+
+    PASSWORD_HASH_SECONDS.labels(op).observe(elapsed)
+    return result
+
+
+async def hash_password(password: str) -> str:
+    return await _run("hash", _hash, password)
+
+
+async def verify_password(password: str, password_hash: str) -> bool:
+    return await _run("verify", _verify, password, password_hash)
+
+
+async def hash_passwords(passwords: List[str]) -> List[str]:
+    """
+    Хэши для массового импорта. Идёт мимо очереди допуска, но в пуле одновременно
+    не больше password_hash_workers пачек от всех импортов процесса, чтобы между
+    ними успевали логины.
+    """
+    global _import_slots
+    if _import_slots is None:
+        _import_slots = asyncio.Semaphore(get_settings().password_hash_workers)
+    loop = asyncio.get_running_loop()
+
+    async def run_chunk(chunk: list) -> list:
+        async with _import_slots:
+            hashes, elapsed = await loop.run_in_executor(get_pool(), _hash_many, chunk)
+        PASSWORD_HASH_SECONDS.labels("import").observe(elapsed / len(chunk))
+        return hashes
+
+    chunks = [passwords[i:i + IMPORT_HASH_CHUNK] for i in range(0, len(passwords), IMPORT_HASH_CHUNK)]
+    results = await asyncio.gather(*(run_chunk(chunk) for chunk in chunks))
+    return [password_hash for chunk in results for password_hash in chunk]
@@ -1,4 +1,5 @@
 import redis
+import redis.asyncio
 from redis import Redis
 import os
 
@@ -10,4 +11,10 @@ try:
 except Exception as e:
     print("Ошибка подключения:", e)
 
-redis_client = redis_client
\ No newline at end of file
+redis_client = redis_client
+
+# Клиент для async-обработчиков, чтобы не блокировать event loop
+async_redis_client = redis.asyncio.from_url(os.getenv("REDIS_URL"), decode_responses=True)
+
+# Бинарный клиент для готовых байтовых ответов (векторные тайлы и т.п.)
+async_redis_binary_client = redis.asyncio.from_url(os.getenv("REDIS_URL"), decode_responses=False)
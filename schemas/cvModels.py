@@ -1,5 +1,11 @@
-from pydantic import BaseModel
+from pydantic import AwareDatetime, BaseModel
 
 
 class ParkingUpdate(BaseModel):
     occupancy: int
+
+
+class OccupancyObservation(BaseModel):
+    id_parking: int
+    occupancy: int
+    observed_at: AwareDatetime
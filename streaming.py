@@ -0,0 +1,88 @@
+"""
+Потоковые ответы (NDJSON и GeoJSON FeatureCollection) поверх database.iter_query.
+
+Генератор iter_query держит соединение из пула, пока его не закроют. Поэтому
+строки читаются через async-обёртку, которая по окончании ответа — в том числе
+при обрыве соединения клиентом — закрывает генераторы и возвращает соединение в пул.
+"""
+import json
+from typing import AsyncIterator, Callable, Iterable, Iterator, Optional
+
+import anyio
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+
+# Сколько объектов склеивать в один чанк ответа, чтобы не писать в сокет по строке
+CHUNK_SIZE = 500
+
+
+def _chunks(parts: Iterable[str]) -> Iterator[bytes]:
+    buffer = []
+    for part in parts:
+        buffer.append(part)
+        if len(buffer) >= CHUNK_SIZE:
+            yield "".join(buffer).encode()
+            buffer = []
+    if buffer:
+        yield "".join(buffer).encode()
+
+
+def _ndjson_lines(rows: Iterable, to_item: Callable) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(to_item(row), default=str, ensure_ascii=False) + "\n"
+
+
+def _feature_collection_parts(rows: Iterable, to_feature: Callable) -> Iterator[str]:
+    yield '{"type":"FeatureCollection","features":['
+    first = True
+    for row in rows:
+        yield to_feature(row) if first else "," + to_feature(row)
+        first = False
+    yield "]}"
+
+
+async def _closing(chunks: Iterator[bytes], rows: Iterable) -> AsyncIterator[bytes]:
+    """Читает чанки в threadpool и в любом случае закрывает генераторы (и соединение rows)."""
+    try:
+        while True:
+            chunk = await run_in_threadpool(next, chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        # При обрыве клиента сюда приходим уже отменёнными — закрытие нужно доделать
+        with anyio.CancelScope(shield=True):
+            for generator in (chunks, rows):
+                close = getattr(generator, "close", None)
+                if close is not None:
+                    await run_in_threadpool(close)
+
+
+class _ClosingStreamingResponse(StreamingResponse):
+    """StreamingResponse, закрывающий тело и тогда, когда отправка прервалась между чанками."""
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            with anyio.CancelScope(shield=True):
+                await self.body_iterator.aclose()
+
+
+def ndjson_response(rows: Iterable, to_item: Callable) -> StreamingResponse:
+    chunks = _chunks(_ndjson_lines(rows, to_item))
+    return _ClosingStreamingResponse(_closing(chunks, rows), media_type="application/x-ndjson")
+
+
+def geojson_response(rows: Iterable, to_feature: Callable) -> StreamingResponse:
+    """to_feature должен возвращать уже сериализованный Feature (строку JSON)."""
+    chunks = _chunks(_feature_collection_parts(rows, to_feature))
+    return _ClosingStreamingResponse(_closing(chunks, rows), media_type="application/geo+json")
+
+
+def feature(geometry_json: Optional[str], properties: dict) -> str:
+    """Собирает Feature, вставляя готовый GeoJSON геометрии без повторного парсинга; без геометрии — null."""
+    return (
+        '{"type":"Feature","geometry":' + (geometry_json if geometry_json is not None else "null")
+        + ',"properties":' + json.dumps(properties, default=str, ensure_ascii=False) + "}"
+    )
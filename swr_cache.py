@@ -0,0 +1,207 @@
+"""
+Чтение через Redis-кэш с защитой от stampede и stale-while-revalidate.
+
+Значение хранится обычным ключом с EX = hard_ttl, так что его читают и пишут и
+другие пути (MGET, SET из обработчиков записи). Возраст значения вычисляется по
+оставшемуся TTL (GET и TTL одним pipeline):
+
+* моложе soft_ttl — отдаётся как есть;
+* старше soft_ttl — отдаётся сразу, а обновление уходит в фоновую задачу;
+* ключа нет — загружает только один запрос: внутри процесса остальные ждут его
+  future, между процессами — короткий lock в Redis, остальные ждут появления ключа
+  до LOCK_WAIT секунд и только потом идут в БД сами.
+
+Перед Redis стоит in-process l1_cache: в него попадают только свежие значения и
+не дольше, чем им осталось до soft_ttl.
+
+Загрузка из БД может закончиться позже, чем обработчик записи положит в ключ
+более новое значение. Поэтому у ключа есть счётчик поколения ({key}:gen):
+обработчики записи увеличивают его (bump_generations) после коммита в БД, а
+загрузка пишет результат Lua-скриптом только при том же поколении, что было до
+её запроса в БД.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from prometheus_client import Counter
+
+from l1_cache import CACHE_TIER_REQUESTS, l1_cache
+from redis_client import async_redis_client as async_redis
+
+logger = logging.getLogger(__name__)
+
+LOCK_TTL_MS = 5000
+LOCK_WAIT = 0.2
+LOCK_POLL_INTERVAL = 0.02
+# Счётчик поколения должен пережить любую загрузку, начатую до записи
+GENERATION_TTL = 3600
+
+CACHE_REQUESTS = Counter("swr_cache_requests_total", "Чтения через swr_cache", ["cache", "result"])
+
+_inflight: Dict[str, asyncio.Future] = {}
+_background: Set[asyncio.Task] = set()
+
+# KEYS — ключ значения и ключ поколения; ARGV — значение, EX, ожидаемое поколение ('' — счётчика нет)
+_SET_IF_GENERATION = async_redis.register_script("""
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[3] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return 1
+""")
+
+
+def _generation_key(key: str) -> str:
+    return f"{key}:gen"
+
+
+def bump_generations(keys: Iterable[str], pipe):
+    """
+    Добавляет в pipeline (sync или async) смену поколения ключей: начатые раньше
+    загрузки их уже не перезапишут. Вызывается после коммита записи в БД.
+    """
+    for key in keys:
+        pipe.incr(_generation_key(key))
+        pipe.expire(_generation_key(key), GENERATION_TTL)
+
+
+async def get_generations(keys: List[str]) -> Optional[List[str]]:
+    """Текущие поколения ключей ('' — ещё не менялись) или None, если Redis недоступен."""
+    try:
+        return [generation or "" for generation in await async_redis.mget([_generation_key(key) for key in keys])]
+    except Exception:
+        return None
+
+
+def set_if_generation(key: str, value: str, ttl: int, generation: str, client=None):
+    """SET key value EX ttl, если поколение ключа всё ещё generation. С client — в его pipeline."""
+    return _SET_IF_GENERATION(keys=[key, _generation_key(key)], args=[value, ttl, generation], client=client)
+
+
+def _lock_key(key: str) -> str:
+    return f"{key}:lock"
+
+
+async def _try_lock(key: str) -> bool:
+    try:
+        return bool(await async_redis.set(_lock_key(key), 1, nx=True, px=LOCK_TTL_MS))
+    except Exception:
+        return True
+
+
+async def _unlock(key: str):
+    try:
+        await async_redis.delete(_lock_key(key))
+    except Exception:
+        pass
+
+
+async def _load(key: str, loader: Callable[[], Awaitable[Any]], hard_ttl: int, encode: Callable) -> Any:
+    """Загрузка с single-flight внутри процесса: конкурентные вызовы ждут один future."""
+    future = _inflight.get(key)
+    if future is not None:
+        return await asyncio.shield(future)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        # Поколение — до запроса в БД: запись, закоммиченная после него, его сменит
+        generations = await get_generations([key])
+        value = await loader()
+        if value is not None and generations is not None:
+            try:
+                await set_if_generation(key, encode(value), hard_ttl, generations[0])
+            except Exception:
+                pass
+        future.set_result(value)
+        return value
+    except BaseException as e:
+        future.set_exception(e)
+        # Исключение получит и тот, кто ждёт future; помечаем его прочитанным
+        future.exception()
+        raise
+    finally:
+        del _inflight[key]
+
+
+async def _refresh(key: str, loader: Callable[[], Awaitable[Any]], hard_ttl: int, encode: Callable):
+    try:
+        await _load(key, loader, hard_ttl, encode)
+    except Exception:
+        logger.exception("Background refresh of %s failed", key)
+    finally:
+        await _unlock(key)
+
+
+async def get_or_load(
+    name: str,
+    key: str,
+    loader: Callable[[], Awaitable[Optional[Any]]],
+    soft_ttl: float,
+    hard_ttl: int,
+    decode: Callable[[str], Any] = str,
+    encode: Callable[[Any], str] = str,
+) -> Tuple[Optional[Any], str]:
+    """
+    Возвращает (значение, источник): "cache" — свежее из кэша, "stale" — из кэша
+    старше soft_ttl (обновление уже запущено), "db" — загружено loader. loader
+    возвращает None, если объекта нет, — такой результат не кэшируется.
+    name — метка кэша в метриках.
+    """
+    value = l1_cache.get(key)
+    if value is not None:
+        CACHE_REQUESTS.labels(name, "hit").inc()
+        return value, "cache"
+
+    try:
+        pipe = async_redis.pipeline(transaction=False)
+        pipe.get(key)
+        pipe.ttl(key)
+        raw, ttl = await pipe.execute()
+    except Exception:
+        raw, ttl = None, -2
+
+    CACHE_TIER_REQUESTS.labels("redis", "hit" if raw is not None else "miss").inc()
+    if raw is not None:
+        age = hard_ttl - ttl if ttl >= 0 else 0
+        if age > soft_ttl:
+            if key not in _inflight and await _try_lock(key):
+                task = asyncio.create_task(_refresh(key, loader, hard_ttl, encode))
+                _background.add(task)
+                task.add_done_callback(_background.discard)
+            CACHE_REQUESTS.labels(name, "stale").inc()
+            return decode(raw), "stale"
+        value = decode(raw)
+        l1_cache.set(key, value, soft_ttl - age)
+        CACHE_REQUESTS.labels(name, "hit").inc()
+        return value, "cache"
+
+    if key in _inflight:
+        CACHE_REQUESTS.labels(name, "coalesced").inc()
+        return await _load(key, loader, hard_ttl, encode), "db"
+
+    if await _try_lock(key):
+        CACHE_REQUESTS.labels(name, "miss").inc()
+        try:
+            value = await _load(key, loader, hard_ttl, encode)
+        finally:
+            await _unlock(key)
+        if value is not None:
+            l1_cache.set(key, value, soft_ttl)
+        return value, "db"
+
+    # Ключ грузит другой процесс — ждём его результат, но недолго
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + LOCK_WAIT
+    while loop.time() < deadline:
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+        try:
+            raw = await async_redis.get(key)
+        except Exception:
+            break
+        if raw is not None:
+            CACHE_REQUESTS.labels(name, "hit_after_wait").inc()
+            return decode(raw), "cache"
+    CACHE_REQUESTS.labels(name, "miss").inc()
+    return await _load(key, loader, hard_ttl, encode), "db"
@@ -0,0 +1,100 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from redis_client import async_redis_binary_client as async_redis_binary
+from redis_client import redis_client as redis
+
+
+# Занятость парковок меняется каждые несколько секунд и не сбрасывает версию слоя,
+# поэтому тайлы парковок живут в кэше не дольше кэша занятости (OCCUPANCY_CACHE_TTL).
+TILE_CACHE_TTL = {
+    "parkings": 60,
+    "sim_stops": 24 * 60 * 60,
+    "bus_stops": 24 * 60 * 60,
+}
+TILE_LOCAL_CACHE_SIZE = 2048
+# Сколько секунд процесс доверяет закэшированной версии слоя, прежде чем перечитать её из Redis
+TILE_VERSION_TTL = 2
+
+
+def _version_key(layer: str) -> str:
+    return f"tiles:{layer}:version"
+
+
+def _tile_key(layer: str, version: int, z: int, x: int, y: int) -> str:
+    return f"tiles:{layer}:v{version}:{z}:{x}:{y}"
+
+
+_local_tiles: "OrderedDict[str, tuple]" = OrderedDict()
+_local_versions: dict = {}
+
+
+def bump_layer_version(layer: str):
+    """
+    Инвалидирует все тайлы слоя. Версия входит в ключ кэша, поэтому старые тайлы
+    просто перестают читаться и со временем вытесняются по TTL/LRU.
+    """
+    try:
+        redis.incr(_version_key(layer))
+    except Exception:
+        pass
+    _local_versions.pop(layer, None)
+
+
+async def get_layer_version(layer: str) -> int:
+    cached = _local_versions.get(layer)
+    now = time.monotonic()
+    if cached is not None and cached[1] > now:
+        return cached[0]
+
+    try:
+        raw = await async_redis_binary.get(_version_key(layer))
+        version = int(raw) if raw is not None else 0
+    except Exception:
+        # Без Redis продолжаем работать с последней известной версией
+        return cached[0] if cached is not None else 0
+
+    _local_versions[layer] = (version, now + TILE_VERSION_TTL)
+    return version
+
+
+async def get_tile(layer: str, version: int, z: int, x: int, y: int) -> Optional[bytes]:
+    key = _tile_key(layer, version, z, x, y)
+
+    cached = _local_tiles.get(key)
+    if cached is not None:
+        tile, expires_at = cached
+        if expires_at > time.monotonic():
+            _local_tiles.move_to_end(key)
+            return tile
+        del _local_tiles[key]
+
+    try:
+        pipe = async_redis_binary.pipeline(transaction=False)
+        pipe.get(key)
+        pipe.ttl(key)
+        tile, ttl = await pipe.execute()
+    except Exception:
+        return None
+
+    if tile is not None and ttl > 0:
+        _remember(key, tile, ttl)
+    return tile
+
+
+async def set_tile(layer: str, version: int, z: int, x: int, y: int, tile: bytes):
+    key = _tile_key(layer, version, z, x, y)
+    ttl = TILE_CACHE_TTL[layer]
+    _remember(key, tile, ttl)
+    try:
+        await async_redis_binary.set(key, tile, ex=ttl)
+    except Exception:
+        pass
+
+
+def _remember(key: str, tile: bytes, ttl: int):
+    _local_tiles[key] = (tile, time.monotonic() + ttl)
+    _local_tiles.move_to_end(key)
+    while len(_local_tiles) > TILE_LOCAL_CACHE_SIZE:
+        _local_tiles.popitem(last=False)
@@ -0,0 +1,82 @@
+"""
+Разбор файла массового импорта пользователей (CSV с заголовком или NDJSON).
+
+Поля строки: email, password, phone_number (необязательно), subscription_status
+(необязательно, true/false/1/0/yes/no). Ошибки разбора и проверки копятся по
+номерам строк и не прерывают импорт остальных.
+"""
+import csv
+import io
+import json
+from typing import Iterable, List, Tuple
+
+# Ограничения колонок users (см. parking.sql)
+MAX_EMAIL_LENGTH = 255
+MAX_PHONE_LENGTH = 50
+MAX_IMPORT_ROWS = 50000
+MAX_IMPORT_BODY_BYTES = 16 * 1024 * 1024
+# Строк в одной пачке импорта: хэширование и вставка пачки — одна транзакция
+IMPORT_BATCH_ROWS = 100
+
+_TRUE = {"true", "1", "yes", "y", "t"}
+_FALSE = {"false", "0", "no", "n", "f", ""}
+
+
+def _records(body: str, fmt: str) -> Iterable[Tuple[int, object]]:
+    if fmt == "csv":
+        for number, record in enumerate(csv.DictReader(io.StringIO(body)), start=1):
+            yield number, record
+        return
+    for number, line in enumerate((line for line in body.splitlines() if line.strip()), start=1):
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, None
+
+
+def _parse_bool(value) -> bool:
+    if isinstance(value, bool) or value is None:
+        return bool(value)
+    text = str(value).strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    raise ValueError("subscription_status must be a boolean")
+
+
+def parse(body: str, fmt: str) -> Tuple[List[tuple], List[dict]]:
+    """
+    Возвращает (валидные строки (номер, email, password, phone_number, subscription_status),
+    ошибки [{"row", "email", "error"}]). Повтор email в файле — ошибка для всех
+    вхождений, кроме первого.
+    """
+    rows, errors, seen = [], [], set()
+    for number, record in _records(body, fmt):
+        if number > MAX_IMPORT_ROWS:
+            errors.append({"row": number, "email": None, "error": f"Import is limited to {MAX_IMPORT_ROWS} rows"})
+            break
+        if not isinstance(record, dict):
+            errors.append({"row": number, "email": None, "error": "Malformed row"})
+            continue
+
+        email = str(record.get("email") or "").strip()
+        password = record.get("password")
+        phone = str(record.get("phone_number") or "").strip() or None
+        try:
+            if not email or len(email) > MAX_EMAIL_LENGTH:
+                raise ValueError("email is missing or too long")
+            if not password or not isinstance(password, str):
+                raise ValueError("password is missing")
+            if phone is not None and len(phone) > MAX_PHONE_LENGTH:
+                raise ValueError("phone_number is too long")
+            subscription = _parse_bool(record.get("subscription_status"))
+            if email in seen:
+                raise ValueError("Duplicate email in file")
+        except ValueError as e:
+            errors.append({"row": number, "email": email or None, "error": str(e)})
+            continue
+
+        seen.add(email)
+        rows.append((number, email, password, phone, subscription))
+    return rows, errors
@@ -0,0 +1,55 @@
+"""
+Периодическая сверка счётчиков users_stats с таблицей users.
+
+Счётчики ведут триггеры (migrations/006_users_stats.sql); сверка раз в
+RECONCILE_INTERVAL исправляет возможный дрейф, например после ручных правок
+с отключёнными триггерами.
+"""
+import logging
+import threading
+from typing import Optional
+
+from prometheus_client import Counter
+
+from dao.users_dao import UsersDAO
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_INTERVAL = 3600.0
+
+USERS_STATS_DRIFT = Counter("users_stats_drift_total", "Сверки users_stats, нашедшие расхождение")
+
+
+class UserStatsJob:
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self):
+        before, after = UsersDAO.reconcile_stats()
+        if tuple(before) != tuple(after):
+            USERS_STATS_DRIFT.inc()
+            logger.warning("users_stats drift corrected: %s -> %s", tuple(before), tuple(after))
+
+    def _run(self):
+        while not self._stop.wait(RECONCILE_INTERVAL):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("users_stats reconciliation failed")
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="user-stats", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+user_stats_job = UserStatsJob()